@@ -1,15 +1,21 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
-import json
+import importlib.util
+import os
 
-# Import plotly with error handling
-try:
-    import plotly.graph_objects as go
-    import plotly.express as px
-    PLOTLY_AVAILABLE = True
-except ImportError:
-    PLOTLY_AVAILABLE = False
+import ingest
+import instrumentation
+import storage
+from engine import LedgerEngine, make_writer
+from exports import EXPORT_FORMATS, available_formats, export_buffer
+from importer import prepare_import, to_transactions
+from ledger import (
+    CHART_WINDOWS, bucket_labels, bucket_totals, display_table, lttb_indices, period_bounds
+)
+
+# Plotly تُستورد عند أول رسم بياني فقط: استيرادها يضاعف زمن بدء الجلسة
+PLOTLY_AVAILABLE = importlib.util.find_spec('plotly') is not None
 
 # إعدادات الصفحة
 st.set_page_config(
@@ -19,6 +25,10 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# قياس زمن مراحل إعادة التشغيل (معطل افتراضياً - انظر instrumentation.py)
+show_debug_panel = instrumentation.debug_panel_enabled(st.query_params.get('debug'))
+instrumentation.start_rerun(enabled=show_debug_panel)
+
 # CSS مخصص للتصميم المطابق للصورة بالضبط
 st.markdown("""
 <style>
@@ -196,29 +206,69 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # تهيئة البيانات في Session State
-if 'transactions' not in st.session_state:
-    st.session_state.transactions = []
 if 'current_period' not in st.session_state:
     st.session_state.current_period = 'all'
 
+# قيم عناصر التحكم داخل التبويبات: التبويب غير المفتوح لا يُنفذ، و Streamlit
+# يحذف حالة العنصر الذي لم يُعرض، لذلك تُعاد كتابتها في كل إعادة تشغيل
+PERSISTENT_WIDGETS = {
+    'chart_window': 7,
+    'tx_search': '',
+    'tx_type': 'all',
+    'tx_category': 'الكل',
+    'tx_sort_by': 'date',
+    'tx_descending': True,
+    'tx_page_size': 50,
+    'tx_page': 1,
+    'cmp_freq': 'M',
+    'cmp_periods': 12,
+}
+for widget_key, default in PERSISTENT_WIDGETS.items():
+    st.session_state[widget_key] = st.session_state.get(widget_key, default)
+
+CHART_WINDOW_LABELS = {7: "آخر 7 أيام", 30: "آخر 30 يوماً", 90: "آخر 90 يوماً", 365: "آخر سنة", 0: "كل الفترة"}
+# أقصى عدد نقاط لكل خط يُرسل للمتصفح، السلاسل الأطول تُختصر بـ LTTB
+CHART_MAX_POINTS = int(os.environ.get('PL_CHART_MAX_POINTS', '500'))
+
+SORT_LABELS = {"date": "التاريخ", "amount": "المبلغ", "category": "الفئة", "type": "النوع"}
+PAGE_SIZES = [25, 50, 100, 200]
+# تقسيم مقارنة الفترات -> (التسمية، أقصى عدد فترات)
+COMPARISON_FREQS = {"M": ("شهري", 60), "Q": ("ربع سنوي", 20)}
+# ترتيب التاريخ في ملف الاستيراد (importer.DATE_ORDERS)
+DATE_ORDER_LABELS = {
+    "ymd": "سنة-شهر-يوم (2024-03-05)",
+    "dmy": "يوم/شهر/سنة (05/03/2024)",
+    "mdy": "شهر/يوم/سنة (03/05/2024)",
+}
+
 # دوال مساعدة
+@st.cache_resource
+def get_ledger_cache():
+    """محرك السجل مشترك بين كل الجلسات ويُعاد بناؤه فقط عند تغير بصمة البيانات"""
+    return LedgerEngine()
+
 def load_transactions():
     """تحميل المعاملات من ملف JSON"""
-    try:
-        with open('transactions.json', 'r', encoding='utf-8') as f:
-            st.session_state.transactions = json.load(f)
-    except FileNotFoundError:
-        st.session_state.transactions = []
+    engine = get_ledger_cache()
+    with instrumentation.span('load') as info, engine.lock:
+        info['cached'] = engine.refresh()
+        st.session_state.data_version = engine.version
+        st.session_state.ledger = engine.ledger
+        st.session_state.totals = engine.totals
 
-def save_transactions():
-    """حفظ المعاملات في ملف JSON"""
-    with open('transactions.json', 'w', encoding='utf-8') as f:
-        json.dump(st.session_state.transactions, f, ensure_ascii=False, indent=2)
+@st.cache_resource
+def get_writer():
+    """خيط الكتابة الوحيد في العملية - كل الجلسات تكتب من خلاله"""
+    return make_writer(get_ledger_cache())
+
+@st.cache_resource
+def get_ingest_server():
+    """واجهة الاستقبال HTTP داخل عملية التطبيق - نفس المحرك وخيط الكتابة (PL_INGEST_PORT)"""
+    return ingest.start_server(get_ledger_cache(), get_writer(), port=int(ingest.INGEST_PORT))
 
 def add_transaction(trans_type, category, amount, date, description):
     """إضافة معاملة جديدة"""
     transaction = {
-        'id': len(st.session_state.transactions) + 1,
         'type': trans_type,
         'category': category,
         'amount': float(amount),
@@ -226,51 +276,187 @@ def add_transaction(trans_type, category, amount, date, description):
         'description': description,
         'timestamp': datetime.now().isoformat()
     }
-    st.session_state.transactions.append(transaction)
-    save_transactions()
+    return get_writer().submit(('add', transaction))
 
 def delete_transaction(trans_id):
     """حذف معاملة"""
-    st.session_state.transactions = [t for t in st.session_state.transactions if t['id'] != trans_id]
-    save_transactions()
+    return get_writer().submit(('delete', trans_id))
+
+def import_transactions(rows):
+    """إضافة دفعة معاملات (DataFrame من prepare_import) بكتابة واحدة إلى التخزين"""
+    if rows.empty:
+        return 0
+    return get_writer().submit(('import', to_transactions(rows)))
+
+def query_transactions(date_from=None, date_to=None, trans_type=None, category=None):
+    """جلب المعاملات المطابقة للفلاتر كـ DataFrame مرتب حسب التاريخ (الحدود شاملة)"""
+    with instrumentation.span('filter') as info:
+        result = get_ledger_cache().query(date_from, date_to, trans_type, category)
+        info['rows'] = len(result)
+    return result
+
+def get_transactions_page(trans_type=None, category=None, sort_by='date', descending=True, page=1, page_size=50,
+                          text=None):
+    """صفحة واحدة من المعاملات المرتبة وعدد كل المعاملات المطابقة (وللنص إذا حُدد)"""
+    offset = (page - 1) * page_size
+    return get_ledger_cache().page(trans_type, category, sort_by, descending, offset, page_size, text)
+
+def get_transaction(trans_id):
+    """معاملة واحدة بالرقم أو None"""
+    return get_ledger_cache().get(trans_id)
+
+def search_transactions(text, trans_type=None, category=None, limit=20):
+    """البحث عن معاملات بالرقم أو بنص من الوصف/الفئة - يرجع قائمة dicts"""
+    text = text.strip()
+    if text.lstrip('#').isdigit():
+        transaction = get_transaction(int(text.lstrip('#')))
+        return [transaction] if transaction is not None else []
+    return get_ledger_cache().search(text, trans_type, category, limit)
+
+def has_transactions():
+    """هل توجد أي معاملة؟"""
+    return get_ledger_cache().has_transactions()
+
+def get_categories():
+    """الفئات المستخدمة في المعاملات"""
+    return get_ledger_cache().categories()
+
+def get_category_names():
+    """كل الفئات المتاحة للإضافة: سجل الفئات (الافتراضية والتي أضافها المستخدم)"""
+    return get_ledger_cache().category_names()
+
+def add_category(name):
+    """إضافة فئة جديدة إلى سجل الفئات"""
+    return get_ledger_cache().add_category(name)
+
+def get_period_bounds(period='all'):
+    """حدود الفترة (من، إلى) كنصوص تاريخ، None تعني بدون حد"""
+    return period_bounds(period)
 
 def get_filtered_transactions(period='all'):
     """فلترة المعاملات حسب الفترة"""
-    if not st.session_state.transactions:
-        return []
-    
-    df = pd.DataFrame(st.session_state.transactions)
-    df['date'] = pd.to_datetime(df['date'])
-    
-    today = pd.Timestamp.now().normalize()
-    
-    if period == 'today':
-        df = df[df['date'] >= today]
-    elif period == 'week':
-        week_ago = today - timedelta(days=7)
-        df = df[df['date'] >= week_ago]
-    elif period == 'month':
-        df = df[(df['date'].dt.month == today.month) & (df['date'].dt.year == today.year)]
-    
-    return df.to_dict('records') if not df.empty else []
+    date_from, date_to = get_period_bounds(period)
+    return query_transactions(date_from=date_from, date_to=date_to)
 
-def calculate_stats(transactions):
-    """حساب الإحصائيات"""
-    if not transactions:
-        return 0, 0, 0, 0
-    
-    revenues = [t['amount'] for t in transactions if t['type'] == 'revenue']
-    expenses = [t['amount'] for t in transactions if t['type'] == 'expense']
-    
-    total_revenue = sum(revenues)
-    total_expense = sum(expenses)
-    net_profit = total_revenue - total_expense
-    profit_margin = (net_profit / total_revenue * 100) if total_revenue > 0 else 0
-    
-    return total_revenue, total_expense, net_profit, profit_margin
+def get_period_stats(period='all'):
+    """إحصائيات الفترة من المجاميع المحسوبة مسبقاً بدون المرور على المعاملات"""
+    date_from, date_to = get_period_bounds(period)
+    with instrumentation.span('stats', period=period):
+        return get_ledger_cache().period_stats(date_from, date_to)
+
+def load_plotly():
+    """استيراد Plotly عند الحاجة (مرة واحدة لكل عملية)"""
+    import plotly.graph_objects as go
+    return go
+
+@st.cache_resource(max_entries=64)
+def build_line_chart(data_version, period, window, today):
+    """رسم الإيرادات vs المصروفات، محفوظ حسب (إصدار البيانات، الفترة، النافذة، اليوم)"""
+    # تجميع الإيرادات والمصروفات لكل يوم/أسبوع/شهر في تمريرة واحدة
+    freq = CHART_WINDOWS[window]
+    with instrumentation.span('chart_data', window=window) as info:
+        buckets = bucket_totals(get_filtered_transactions(period), window, freq, end=today)
+        labels = bucket_labels(buckets, freq)
+        info['rows'] = len(buckets)
+
+    go = load_plotly()
+    fig = go.Figure()
+    for column, name, color, fillcolor in (
+        ('revenue', 'الإيرادات', '#10b981', 'rgba(16, 185, 129, 0.1)'),
+        ('expense', 'المصروفات', '#ef4444', 'rgba(239, 68, 68, 0.1)'),
+    ):
+        values = buckets[column].to_numpy()
+        keep = lttb_indices(values, CHART_MAX_POINTS)
+        fig.add_trace(go.Scatter(
+            x=[labels[i] for i in keep],
+            y=values[keep].tolist(),
+            name=name,
+            line=dict(color=color, width=2),
+            mode='lines',
+            fill='tozeroy',
+            fillcolor=fillcolor
+        ))
+    fig.update_layout(
+        height=280,
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        plot_bgcolor='white',
+        paper_bgcolor='white',
+        margin=dict(l=40, r=20, t=10, b=40),
+        xaxis=dict(showgrid=True, gridcolor='#f3f4f6'),
+        yaxis=dict(showgrid=True, gridcolor='#f3f4f6'),
+        font=dict(size=11)
+    )
+    return fig
+
+@st.cache_resource(max_entries=64)
+def build_pie_chart(total_revenue, total_expense):
+    """الرسم الدائري للإيرادات والمصروفات، محفوظ حسب القيمتين"""
+    go = load_plotly()
+    fig = go.Figure(data=[go.Pie(
+        labels=['الإيرادات', 'المصروفات'],
+        values=[total_revenue, total_expense],
+        marker=dict(colors=['#10b981', '#ef4444']),
+        hole=0.5,
+        textinfo='label+percent',
+        textposition='outside',
+        textfont=dict(size=12)
+    )])
+    fig.update_layout(
+        height=280,
+        showlegend=False,
+        margin=dict(l=20, r=20, t=10, b=20),
+        paper_bgcolor='white'
+    )
+    return fig
+
+def reset_transaction_filters():
+    """إعادة فلاتر وترتيب جدول المعاملات للقيم الافتراضية"""
+    for widget_key, default in PERSISTENT_WIDGETS.items():
+        if widget_key.startswith('tx_'):
+            st.session_state[widget_key] = default
+
+def tab_is_open(tab):
+    """هل التبويب معروض الآن؟ الإصدارات الأقدم من Streamlit تنفذ كل التبويبات"""
+    return getattr(tab, 'open', None) is not False
 
-# تحميل البيانات عند البداية
+def timed_export(df, fmt):
+    """إنشاء ملف التصدير مع تسجيل زمنه (يعمل عند التنزيل وليس أثناء إعادة التشغيل)"""
+    with instrumentation.span('export', format=fmt, rows=len(df)):
+        return export_buffer(df, fmt)
+
+def render_debug_panel(summary):
+    """لوحة أداء إعادة التشغيل الحالية"""
+    with st.expander(f"🛠️ الأداء: {summary['total_ms']:,.1f} ms", expanded=False):
+        spans = pd.DataFrame(summary['spans'])
+        if not spans.empty:
+            spans['name'] = ['\u2003' * depth + name for depth, name in zip(spans['depth'], spans['name'])]
+            first = [c for c in ('name', 'ms', 'rows', 'rss_delta_mb') if c in spans.columns]
+            spans = spans[first + [c for c in spans.columns if c not in first and c != 'depth']]
+            st.dataframe(spans, use_container_width=True, hide_index=True)
+        st.caption(f"ذاكرة العملية: {summary['rss_mb']} MB (تغير {summary['rss_delta_mb']} MB)")
+        if summary.get('profile'):
+            st.caption(f"ملف المحلل: {summary['profile']}")
+
+def render_pending_writes():
+    """حالة الحفظ في وضع الكتابة غير المتزامنة: عدد العمليات التي لم تُحفظ بعد"""
+    writer = get_writer()
+    pending = writer.pending()
+    if writer.error is not None:
+        st.caption(f"⚠️ تعذر حفظ {pending:,} عملية - ستتم إعادة المحاولة تلقائياً")
+    elif pending:
+        st.caption(f"⏳ {pending:,} عملية في انتظار الحفظ")
+    else:
+        st.caption("✅ كل التغييرات محفوظة")
+
+# المؤشر يتحدث وحده كل ثانية دون إعادة تشغيل الصفحة (الإصدارات الأقدم: مع كل إعادة تشغيل)
+if hasattr(st, 'fragment'):
+    render_pending_writes = st.fragment(run_every=1)(render_pending_writes)
+
+# تحميل البيانات عند البداية - من الذاكرة المشتركة ما لم تتغير البيانات على القرص
 load_transactions()
+if ingest.INGEST_PORT:
+    get_ingest_server()
 
 # Header مخصص
 st.markdown("""
@@ -280,352 +466,485 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# مكان مؤشر الحفظ أسفل العنوان - يُملأ في نهاية السكريبت بعد عمليات هذه الإعادة
+pending_writes_slot = st.container() if isinstance(get_writer(), storage.DebouncedWriter) else None
+
 # Tabs
-tab1, tab2, tab3, tab4 = st.tabs(["لوحة التحكم", "المعاملات", "التقارير", "إضافة معاملة"])
+# التبويب المفتوح فقط يُنفذ: الرسوم البيانية لا تُبنى عند إضافة معاملة مثلاً
+TAB_NAMES = ["لوحة التحكم", "المعاملات", "التقارير", "إضافة معاملة"]
+try:
+    tab1, tab2, tab3, tab4 = st.tabs(TAB_NAMES, key="active_tab", on_change="rerun")
+except TypeError:
+    tab1, tab2, tab3, tab4 = st.tabs(TAB_NAMES)
 
 # Tab 1: لوحة التحكم
 with tab1:
-    st.markdown('<div class="content-wrapper">', unsafe_allow_html=True)
-    
-    # Filter Buttons في صف واحد على اليمين
-    col_space, col_btn1, col_btn2, col_btn3, col_btn4 = st.columns([4, 1, 1.2, 1.2, 0.8])
-    
-    with col_btn4:
-        if st.button("الكل", key="all"):
-            st.session_state.current_period = 'all'
-            st.rerun()
-    with col_btn3:
-        if st.button("هذا الشهر", key="month"):
-            st.session_state.current_period = 'month'
-            st.rerun()
-    with col_btn2:
-        if st.button("هذا الأسبوع", key="week"):
-            st.session_state.current_period = 'week'
-            st.rerun()
-    with col_btn1:
-        if st.button("اليوم", key="today"):
-            st.session_state.current_period = 'today'
-            st.rerun()
-    
-    st.markdown("<div style='margin: 20px 0;'></div>", unsafe_allow_html=True)
-    
-    # الحصول على المعاملات المفلترة
-    filtered_trans = get_filtered_transactions(st.session_state.current_period)
-    total_revenue, total_expense, net_profit, profit_margin = calculate_stats(filtered_trans)
-    
-    # الكروت الرئيسية - 4 كروت متساوية
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-label">إجمالي الإيرادات</div>
-            <div class="metric-value green">{total_revenue:.2f} <span class="metric-unit">ج.م</span></div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col2:
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-label">إجمالي المصروفات</div>
-            <div class="metric-value red">{total_expense:.2f} <span class="metric-unit">ج.م</span></div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col3:
-        profit_color = "green" if net_profit >= 0 else "red"
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-label">صافي الربح/الخسارة</div>
-            <div class="metric-value {profit_color}">{net_profit:.2f} <span class="metric-unit">ج.م</span></div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    with col4:
-        margin_color = "green" if profit_margin >= 0 else "red"
-        st.markdown(f"""
-        <div class="metric-card">
-            <div class="metric-label">نسبة الربح</div>
-            <div class="metric-value {margin_color}">{profit_margin:.2f}%</div>
-        </div>
-        """, unsafe_allow_html=True)
-    
-    st.markdown("<div style='margin: 25px 0;'></div>", unsafe_allow_html=True)
-    
-    # الرسوم البيانية
-    if filtered_trans and PLOTLY_AVAILABLE:
-        col_chart1, col_chart2 = st.columns([1, 1])
+    if tab_is_open(tab1):
+        st.markdown('<div class="content-wrapper">', unsafe_allow_html=True)
         
-        with col_chart1:
-            st.markdown('<div class="chart-box">', unsafe_allow_html=True)
-            st.markdown('<div class="chart-title">📈 الإيرادات vs المصروفات (آخر 7 أيام)</div>', unsafe_allow_html=True)
-            
-            # إعداد البيانات لآخر 7 أيام
-            dates = pd.date_range(end=pd.Timestamp.now(), periods=7).date
-            df = pd.DataFrame(filtered_trans)
-            df['date'] = pd.to_datetime(df['date']).dt.date
-            
-            revenue_data = []
-            expense_data = []
-            
-            for date in dates:
-                rev = df[(df['type'] == 'revenue') & (df['date'] == date)]['amount'].sum()
-                exp = df[(df['type'] == 'expense') & (df['date'] == date)]['amount'].sum()
-                revenue_data.append(rev)
-                expense_data.append(exp)
-            
-            # رسم بياني خطي
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(
-                x=list(range(7)),
-                y=revenue_data,
-                name='الإيرادات',
-                line=dict(color='#10b981', width=2),
-                mode='lines',
-                fill='tozeroy',
-                fillcolor='rgba(16, 185, 129, 0.1)'
-            ))
-            fig.add_trace(go.Scatter(
-                x=list(range(7)),
-                y=expense_data,
-                name='المصروفات',
-                line=dict(color='#ef4444', width=2),
-                mode='lines',
-                fill='tozeroy',
-                fillcolor='rgba(239, 68, 68, 0.1)'
-            ))
-            fig.update_layout(
-                height=280,
-                showlegend=True,
-                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-                plot_bgcolor='white',
-                paper_bgcolor='white',
-                margin=dict(l=40, r=20, t=10, b=40),
-                xaxis=dict(showgrid=True, gridcolor='#f3f4f6', tickmode='linear'),
-                yaxis=dict(showgrid=True, gridcolor='#f3f4f6'),
-                font=dict(size=11)
-            )
-            st.plotly_chart(fig, use_container_width=True)
-            st.markdown('</div>', unsafe_allow_html=True)
+        # Filter Buttons في صف واحد على اليمين
+        col_space, col_btn1, col_btn2, col_btn3, col_btn4 = st.columns([4, 1, 1.2, 1.2, 0.8])
         
-        with col_chart2:
-            st.markdown('<div class="chart-box">', unsafe_allow_html=True)
-            st.markdown('<div class="chart-title">🥧 توزيع الإيرادات والمصروفات</div>', unsafe_allow_html=True)
-            
-            # رسم دائري
-            if total_revenue > 0 or total_expense > 0:
-                fig = go.Figure(data=[go.Pie(
-                    labels=['الإيرادات', 'المصروفات'],
-                    values=[total_revenue, total_expense],
-                    marker=dict(colors=['#10b981', '#ef4444']),
-                    hole=0.5,
-                    textinfo='label+percent',
-                    textposition='outside',
-                    textfont=dict(size=12)
-                )])
-                fig.update_layout(
-                    height=280,
-                    showlegend=False,
-                    margin=dict(l=20, r=20, t=10, b=20),
-                    paper_bgcolor='white'
-                )
-                st.plotly_chart(fig, use_container_width=True)
-            else:
-                st.info("لا توجد بيانات لعرضها")
-            
-            st.markdown('</div>', unsafe_allow_html=True)
-    
-    elif not filtered_trans:
-        st.info("📭 لا توجد معاملات في هذه الفترة. ابدأ بإضافة معاملاتك من تبويب 'إضافة معاملة'")
-    elif not PLOTLY_AVAILABLE:
-        st.warning("⚠️ مكتبة Plotly غير متاحة. الرسوم البيانية معطلة مؤقتاً.")
-    
-    st.markdown('</div>', unsafe_allow_html=True)
-
-# Tab 2: المعاملات
-with tab2:
-    st.markdown('<div class="content-wrapper">', unsafe_allow_html=True)
-    
-    if st.session_state.transactions:
-        # فلاتر
-        col1, col2, col3 = st.columns([2, 2, 1])
+        with col_btn4:
+            if st.button("الكل", key="all"):
+                st.session_state.current_period = 'all'
+                st.rerun()
+        with col_btn3:
+            if st.button("هذا الشهر", key="month"):
+                st.session_state.current_period = 'month'
+                st.rerun()
+        with col_btn2:
+            if st.button("هذا الأسبوع", key="week"):
+                st.session_state.current_period = 'week'
+                st.rerun()
+        with col_btn1:
+            if st.button("اليوم", key="today"):
+                st.session_state.current_period = 'today'
+                st.rerun()
+        
+        st.markdown("<div style='margin: 20px 0;'></div>", unsafe_allow_html=True)
+        
+        # الإحصائيات من المجاميع المحسوبة مسبقاً
+        total_revenue, total_expense, net_profit, profit_margin, period_count = get_period_stats(
+            st.session_state.current_period
+        )
+        
+        # الكروت الرئيسية - 4 كروت متساوية
+        col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            filter_type = st.selectbox(
-                "نوع المعاملة",
-                ["all", "revenue", "expense"],
-                format_func=lambda x: {"all": "الكل", "revenue": "إيرادات", "expense": "مصروفات"}[x]
-            )
+            st.markdown(f"""
+            <div class="metric-card">
+                <div class="metric-label">إجمالي الإيرادات</div>
+                <div class="metric-value green">{total_revenue:.2f} <span class="metric-unit">ج.م</span></div>
+            </div>
+            """, unsafe_allow_html=True)
         
         with col2:
-            categories = ["الكل"] + list(set([t['category'] for t in st.session_state.transactions]))
-            filter_category = st.selectbox("الفئة", categories)
+            st.markdown(f"""
+            <div class="metric-card">
+                <div class="metric-label">إجمالي المصروفات</div>
+                <div class="metric-value red">{total_expense:.2f} <span class="metric-unit">ج.م</span></div>
+            </div>
+            """, unsafe_allow_html=True)
         
         with col3:
-            st.markdown("<div style='margin-top: 32px;'></div>", unsafe_allow_html=True)
-            if st.button("🔄 مسح"):
-                st.rerun()
+            profit_color = "green" if net_profit >= 0 else "red"
+            st.markdown(f"""
+            <div class="metric-card">
+                <div class="metric-label">صافي الربح/الخسارة</div>
+                <div class="metric-value {profit_color}">{net_profit:.2f} <span class="metric-unit">ج.م</span></div>
+            </div>
+            """, unsafe_allow_html=True)
+        
+        with col4:
+            margin_color = "green" if profit_margin >= 0 else "red"
+            st.markdown(f"""
+            <div class="metric-card">
+                <div class="metric-label">نسبة الربح</div>
+                <div class="metric-value {margin_color}">{profit_margin:.2f}%</div>
+            </div>
+            """, unsafe_allow_html=True)
         
-        # تطبيق الفلاتر
-        filtered = st.session_state.transactions.copy()
+        st.markdown("<div style='margin: 25px 0;'></div>", unsafe_allow_html=True)
         
-        if filter_type != "all":
-            filtered = [t for t in filtered if t['type'] == filter_type]
+        # الرسوم البيانية
+        if period_count and PLOTLY_AVAILABLE:
+            col_chart1, col_chart2 = st.columns([1, 1])
+            
+            with col_chart1:
+                st.markdown('<div class="chart-box">', unsafe_allow_html=True)
+                chart_window = st.session_state.chart_window
+                st.markdown(f'<div class="chart-title">📈 الإيرادات vs المصروفات ({CHART_WINDOW_LABELS[chart_window]})</div>', unsafe_allow_html=True)
+                st.radio(
+                    "الفترة",
+                    list(CHART_WINDOWS),
+                    key="chart_window",
+                    format_func=CHART_WINDOW_LABELS.get,
+                    horizontal=True,
+                    label_visibility="collapsed"
+                )
+                
+                with instrumentation.span('chart_build', chart='line'):
+                    fig = build_line_chart(st.session_state.data_version, st.session_state.current_period,
+                                           chart_window, datetime.now().date().isoformat())
+                with instrumentation.span('chart_render', chart='line'):
+                    st.plotly_chart(fig, use_container_width=True)
+                st.markdown('</div>', unsafe_allow_html=True)
+            
+            with col_chart2:
+                st.markdown('<div class="chart-box">', unsafe_allow_html=True)
+                st.markdown('<div class="chart-title">🥧 توزيع الإيرادات والمصروفات</div>', unsafe_allow_html=True)
+                
+                # رسم دائري
+                if total_revenue > 0 or total_expense > 0:
+                    with instrumentation.span('chart_build', chart='pie'):
+                        fig = build_pie_chart(total_revenue, total_expense)
+                    with instrumentation.span('chart_render', chart='pie'):
+                        st.plotly_chart(fig, use_container_width=True)
+                else:
+                    st.info("لا توجد بيانات لعرضها")
+                
+                st.markdown('</div>', unsafe_allow_html=True)
         
-        if filter_category != "الكل":
-            filtered = [t for t in filtered if t['category'] == filter_category]
+        elif not period_count:
+            st.info("📭 لا توجد معاملات في هذه الفترة. ابدأ بإضافة معاملاتك من تبويب 'إضافة معاملة'")
+        elif not PLOTLY_AVAILABLE:
+            st.warning("⚠️ مكتبة Plotly غير متاحة. الرسوم البيانية معطلة مؤقتاً.")
         
-        # عرض الجدول
-        if filtered:
-            df = pd.DataFrame(filtered)
-            df['النوع'] = df['type'].map({'revenue': 'إيراد', 'expense': 'مصروف'})
-            df['التاريخ'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
-            df['المبلغ'] = df['amount'].apply(lambda x: f"{x:,.2f} ج.م")
+        st.markdown('</div>', unsafe_allow_html=True)
+
+# Tab 2: المعاملات
+with tab2:
+    if tab_is_open(tab2):
+        st.markdown('<div class="content-wrapper">', unsafe_allow_html=True)
+        
+        if has_transactions():
+            # البحث في الوصف والفئة (فهرس يوحد أشكال الحروف العربية ويحذف التشكيل)
+            table_search = st.text_input(
+                "🔍 بحث في الوصف والفئة",
+                key="tx_search",
+                placeholder="مثال: فاتورة ايجار"
+            ).strip()
             
-            display_df = df[['التاريخ', 'النوع', 'category', 'المبلغ', 'description']].copy()
-            display_df.columns = ['التاريخ', 'النوع', 'الفئة', 'المبلغ', 'الوصف']
+            # فلاتر
+            col1, col2, col3 = st.columns([2, 2, 1])
             
-            st.dataframe(
-                display_df,
-                use_container_width=True,
-                hide_index=True,
-                height=400
-            )
+            with col1:
+                filter_type = st.selectbox(
+                    "نوع المعاملة",
+                    ["all", "revenue", "expense"],
+                    format_func=lambda x: {"all": "الكل", "revenue": "إيرادات", "expense": "مصروفات"}[x],
+                    key="tx_type"
+                )
             
-            # خيار الحذف
-            st.markdown("---")
-            st.subheader("🗑️ حذف معاملة")
+            with col2:
+                categories = ["الكل"] + get_categories()
+                if st.session_state.tx_category not in categories:
+                    st.session_state.tx_category = "الكل"
+                filter_category = st.selectbox("الفئة", categories, key="tx_category")
             
-            trans_to_delete = st.selectbox(
-                "اختر المعاملة للحذف:",
-                options=filtered,
-                format_func=lambda t: f"{t['date']} - {t['category']} - {t['amount']} ج.م"
-            )
+            with col3:
+                st.markdown("<div style='margin-top: 32px;'></div>", unsafe_allow_html=True)
+                st.button("🔄 مسح", on_click=reset_transaction_filters)
             
-            if st.button("حذف المعاملة", type="primary"):
-                delete_transaction(trans_to_delete['id'])
-                st.success("✅ تم حذف المعاملة بنجاح!")
-                st.rerun()
-        else:
-            st.info("لا توجد معاملات تطابق الفلتر المحدد")
-    else:
-        st.info("📭 لا توجد معاملات حتى الآن")
-    
-    st.markdown('</div>', unsafe_allow_html=True)
-
-# Tab 3: التقارير
-with tab3:
-    st.markdown('<div class="content-wrapper">', unsafe_allow_html=True)
-    
-    if st.session_state.transactions:
-        col1, col2, col3 = st.columns([2, 2, 1])
-        
-        with col1:
-            date_from = st.date_input("من تاريخ:", value=datetime.now() - timedelta(days=30))
-        
-        with col2:
-            date_to = st.date_input("إلى تاريخ:", value=datetime.now())
-        
-        with col3:
-            st.markdown("<div style='margin-top: 32px;'></div>", unsafe_allow_html=True)
-            generate_btn = st.button("📊 إنشاء", type="primary")
-        
-        if generate_btn:
-            df = pd.DataFrame(st.session_state.transactions)
-            df['date'] = pd.to_datetime(df['date']).dt.date
+            trans_type = filter_type if filter_type != "all" else None
+            category = filter_category if filter_category != "الكل" else None
             
-            filtered = df[(df['date'] >= date_from) & (df['date'] <= date_to)]
+            # الترتيب والصفحات
+            col1, col2, col3, col4 = st.columns([2, 1, 1, 1])
             
-            if not filtered.empty:
-                revenues = filtered[filtered['type'] == 'revenue']
-                expenses = filtered[filtered['type'] == 'expense']
-                
-                total_revenue = revenues['amount'].sum()
-                total_expense = expenses['amount'].sum()
-                net_profit = total_revenue - total_expense
-                
-                st.markdown("### 📊 ملخص التقرير")
-                
-                col1, col2, col3 = st.columns(3)
-                
-                with col1:
-                    st.metric("إجمالي الإيرادات", f"{total_revenue:,.2f} ج.م")
-                
-                with col2:
-                    st.metric("إجمالي المصروفات", f"{total_expense:,.2f} ج.م")
+            with col1:
+                sort_by = st.selectbox("ترتيب حسب", list(SORT_LABELS), format_func=SORT_LABELS.get, key="tx_sort_by")
+            
+            with col2:
+                descending = st.selectbox("الاتجاه", [True, False], format_func=lambda d: "تنازلي" if d else "تصاعدي", key="tx_descending")
+            
+            with col3:
+                page_size = st.selectbox("عدد الصفوف", PAGE_SIZES, key="tx_page_size")
+            
+            with col4:
+                page = st.number_input("الصفحة", min_value=1, step=1, key="tx_page")
+            
+            with instrumentation.span('table_page', sort_by=sort_by) as info:
+                page_df, total = get_transactions_page(
+                    trans_type, category, sort_by, descending, page, page_size, table_search
+                )
+                info['rows'] = total
+            pages = max(1, -(-total // page_size))
+            if page > pages:
+                # صفحة بعد آخر صفحة (بعد تغيير الفلتر أو الحذف): عرض الصفحة الأخيرة
+                page = pages
+                page_df, total = get_transactions_page(
+                    trans_type, category, sort_by, descending, page, page_size, table_search
+                )
+            
+            # عرض الجدول - التنسيق لصفوف الصفحة الحالية فقط
+            if total > 0:
+                first = (page - 1) * page_size
+                with instrumentation.span('table_format', rows=len(page_df)):
+                    display_df = display_table(page_df)
                 
-                with col3:
-                    st.metric("صافي الربح", f"{net_profit:,.2f} ج.م")
+                with instrumentation.span('table_render'):
+                    st.dataframe(
+                        display_df,
+                        use_container_width=True,
+                        hide_index=True,
+                        height=400
+                    )
+                st.caption(f"صفحة {page:,} من {pages:,} - عرض {first + 1:,} إلى {first + len(page_df):,} من {total:,} معاملة")
                 
+                # خيار الحذف
                 st.markdown("---")
+                st.subheader("🗑️ حذف معاملة")
                 
-                col1, col2 = st.columns(2)
+                search_text = st.text_input("ابحث برقم المعاملة أو بنص من الوصف أو الفئة:")
                 
-                with col1:
-                    csv = filtered.to_csv(index=False, encoding='utf-8-sig')
-                    st.download_button(
-                        label="📥 تحميل CSV",
-                        data=csv,
-                        file_name=f"report_{date_from}_{date_to}.csv",
-                        mime="text/csv",
-                        use_container_width=True
-                    )
+                if search_text.strip():
+                    matches = search_transactions(search_text, trans_type, category)
+                    if matches:
+                        delete_labels = {
+                            t['id']: f"#{t['id']} - {t['date']} - {t['category']} - {t['amount']} ج.م - {t['description']}"
+                            for t in matches
+                        }
+                        trans_to_delete = st.selectbox(
+                            "اختر المعاملة للحذف:",
+                            options=list(delete_labels),
+                            format_func=delete_labels.get
+                        )
+                        
+                        if st.button("حذف المعاملة", type="primary"):
+                            delete_transaction(trans_to_delete)
+                            st.success("✅ تم حذف المعاملة بنجاح!")
+                            st.rerun()
+                    else:
+                        st.info("لا توجد معاملات مطابقة للبحث")
+            else:
+                st.info("لا توجد معاملات تطابق الفلتر المحدد")
+        else:
+            st.info("📭 لا توجد معاملات حتى الآن")
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+
+# Tab 3: التقارير
+with tab3:
+    if tab_is_open(tab3):
+        st.markdown('<div class="content-wrapper">', unsafe_allow_html=True)
+        
+        if has_transactions():
+            col1, col2, col3 = st.columns([2, 2, 1])
+            
+            with col1:
+                date_from = st.date_input("من تاريخ:", value=datetime.now() - timedelta(days=30))
+            
+            with col2:
+                date_to = st.date_input("إلى تاريخ:", value=datetime.now())
+            
+            with col3:
+                st.markdown("<div style='margin-top: 32px;'></div>", unsafe_allow_html=True)
+                generate_btn = st.button("📊 إنشاء", type="primary")
+            
+            if generate_btn:
+                report_from = date_from.strftime('%Y-%m-%d')
+                report_to = date_to.strftime('%Y-%m-%d')
+                # المجاميع من المجاميع البادئة: قيمتان لكل رقم مهما كان طول الفترة
+                with instrumentation.span('report_totals') as info:
+                    total_revenue, total_expense, count = st.session_state.totals.totals(report_from, report_to)
+                    info['rows'] = count
                 
-                with col2:
-                    json_data = filtered.to_json(orient='records', force_ascii=False, indent=2)
-                    st.download_button(
-                        label="📥 تحميل JSON",
-                        data=json_data,
-                        file_name=f"report_{date_from}_{date_to}.json",
-                        mime="application/json",
-                        use_container_width=True
+                if count:
+                    net_profit = total_revenue - total_expense
+                    
+                    st.markdown("### 📊 ملخص التقرير")
+                    
+                    col1, col2, col3 = st.columns(3)
+                    
+                    with col1:
+                        st.metric("إجمالي الإيرادات", f"{total_revenue:,.2f} ج.م")
+                    
+                    with col2:
+                        st.metric("إجمالي المصروفات", f"{total_expense:,.2f} ج.م")
+                    
+                    with col3:
+                        st.metric("صافي الربح", f"{net_profit:,.2f} ج.م")
+                    
+                    category_totals = st.session_state.totals.category_totals(report_from, report_to)
+                    report_categories = sorted({category for category, _ in category_totals})
+                    st.dataframe(
+                        pd.DataFrame({
+                            'الفئة': report_categories,
+                            'الإيرادات': [f"{category_totals.get((c, 'revenue'), 0):,.2f} ج.م" for c in report_categories],
+                            'المصروفات': [f"{category_totals.get((c, 'expense'), 0):,.2f} ج.م" for c in report_categories]
+                        }),
+                        use_container_width=True,
+                        hide_index=True
                     )
-            else:
-                st.warning("⚠️ لا توجد معاملات في هذه الفترة")
-    else:
-        st.info("📭 لا توجد معاملات لإنشاء التقرير")
-    
-    st.markdown('</div>', unsafe_allow_html=True)
+                    
+                    # صفوف الفترة مطلوبة للتصدير فقط
+                    filtered = query_transactions(date_from=report_from, date_to=report_to)
+                    
+                    st.markdown("---")
+                    
+                    # كل زر يُنشئ ملفه عند الضغط فقط وعلى دفعات
+                    export_formats = available_formats()
+                    for col, fmt in zip(st.columns(len(export_formats)), export_formats):
+                        label, mime, extension = EXPORT_FORMATS[fmt]
+                        with col:
+                            st.download_button(
+                                label=f"📥 تحميل {label}",
+                                data=lambda fmt=fmt: timed_export(filtered, fmt),
+                                file_name=f"report_{date_from}_{date_to}.{extension}",
+                                mime=mime,
+                                on_click="ignore",
+                                use_container_width=True
+                            )
+                else:
+                    st.warning("⚠️ لا توجد معاملات في هذه الفترة")
+            
+            st.markdown("---")
+            st.markdown("### 📅 مقارنة الفترات حسب الفئة")
+            
+            col1, col2 = st.columns([1, 2])
+            with col1:
+                st.radio(
+                    "التقسيم",
+                    list(COMPARISON_FREQS),
+                    key="cmp_freq",
+                    format_func=lambda freq: COMPARISON_FREQS[freq][0],
+                    horizontal=True
+                )
+            max_periods = COMPARISON_FREQS[st.session_state.cmp_freq][1]
+            st.session_state.cmp_periods = min(st.session_state.cmp_periods, max_periods)
+            with col2:
+                st.slider("عدد الفترات", min_value=2, max_value=max_periods, key="cmp_periods")
+            
+            with instrumentation.span('comparison', freq=st.session_state.cmp_freq) as info:
+                summary, category_table = get_ledger_cache().comparison(
+                    st.session_state.cmp_freq, st.session_state.cmp_periods
+                )
+                info['rows'] = summary.size + category_table.size
+            
+            if PLOTLY_AVAILABLE:
+                go = load_plotly()
+                fig = go.Figure([
+                    go.Bar(x=summary.index.tolist(), y=summary['revenue'].tolist(), name='الإيرادات', marker_color='#10b981'),
+                    go.Bar(x=summary.index.tolist(), y=summary['expense'].tolist(), name='المصروفات', marker_color='#ef4444'),
+                ])
+                fig.update_layout(
+                    barmode='group',
+                    height=300,
+                    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+                    plot_bgcolor='white',
+                    paper_bgcolor='white',
+                    margin=dict(l=40, r=20, t=10, b=40),
+                    yaxis=dict(showgrid=True, gridcolor='#f3f4f6'),
+                    font=dict(size=11)
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            
+            st.dataframe(
+                pd.DataFrame({
+                    'الفترة': summary.index.tolist(),
+                    'الإيرادات': [f"{x:,.2f} ج.م" for x in summary['revenue']],
+                    'المصروفات': [f"{x:,.2f} ج.م" for x in summary['expense']],
+                    'صافي الربح': [f"{x:,.2f} ج.م" for x in summary['net_profit']],
+                    'التغير': ["" if pd.isna(x) else f"{x:+.1f}%" for x in summary['change_pct']],
+                    'عدد المعاملات': summary['count'].tolist(),
+                }),
+                use_container_width=True,
+                hide_index=True
+            )
+            
+            if not category_table.empty:
+                st.dataframe(
+                    pd.concat([
+                        pd.DataFrame({
+                            'الفئة': category_table.index.get_level_values('category'),
+                            'النوع': category_table.index.get_level_values('type').map({'revenue': 'إيراد', 'expense': 'مصروف'}),
+                        }),
+                        category_table.map(lambda x: f"{x:,.2f}").reset_index(drop=True),
+                    ], axis=1),
+                    use_container_width=True,
+                    hide_index=True
+                )
+        else:
+            st.info("📭 لا توجد معاملات لإنشاء التقرير")
+        
+        st.markdown('</div>', unsafe_allow_html=True)
 
 # Tab 4: إضافة معاملة
 with tab4:
-    st.markdown('<div class="content-wrapper">', unsafe_allow_html=True)
-    
-    with st.form("add_transaction_form", clear_on_submit=True):
-        col1, col2 = st.columns(2)
+    if tab_is_open(tab4):
+        st.markdown('<div class="content-wrapper">', unsafe_allow_html=True)
         
-        with col1:
-            trans_type = st.selectbox(
-                "نوع المعاملة *",
-                ["revenue", "expense"],
-                format_func=lambda x: "إيراد" if x == "revenue" else "مصروف"
-            )
-            
-            amount = st.number_input(
-                "المبلغ (جنيه) *",
-                min_value=0.0,
-                step=0.01,
-                format="%.2f"
-            )
+        category_names = get_category_names()
         
-        with col2:
-            category = st.selectbox(
-                "الفئة *",
-                ["مبيعات", "خدمات", "رواتب", "إيجار", "مواد خام", "تسويق", "مرافق", "صيانة", "أخرى"]
-            )
+        # فئة جديدة تُحفظ في سجل الفئات وتظهر فوراً في قائمة الفئات
+        with st.expander("➕ إضافة فئة جديدة"):
+            new_category = st.text_input("اسم الفئة", key="new_category").strip()
+            if st.button("إضافة الفئة"):
+                if not new_category:
+                    st.error("⚠️ يرجى إدخال اسم الفئة")
+                elif new_category in category_names:
+                    st.info("الفئة موجودة بالفعل")
+                else:
+                    add_category(new_category)
+                    st.success(f"✅ تمت إضافة الفئة: {new_category}")
+                    category_names = get_category_names()
+        
+        with st.form("add_transaction_form", clear_on_submit=True):
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                trans_type = st.selectbox(
+                    "نوع المعاملة *",
+                    ["revenue", "expense"],
+                    format_func=lambda x: "إيراد" if x == "revenue" else "مصروف"
+                )
+                
+                amount = st.number_input(
+                    "المبلغ (جنيه) *",
+                    min_value=0.0,
+                    step=0.01,
+                    format="%.2f"
+                )
             
-            date = st.date_input("التاريخ *", value=datetime.now())
+            with col2:
+                category = st.selectbox("الفئة *", category_names)
+                
+                date = st.date_input("التاريخ *", value=datetime.now())
+            
+            description = st.text_area("الوصف", height=100)
+            
+            submitted = st.form_submit_button("💾 حفظ المعاملة", type="primary", use_container_width=True)
+            
+            if submitted:
+                if amount > 0:
+                    add_transaction(trans_type, category, amount, date, description)
+                    st.success("✅ تم إضافة المعاملة بنجاح!")
+                    st.balloons()
+                else:
+                    st.error("⚠️ يرجى إدخال مبلغ أكبر من صفر")
         
-        description = st.text_area("الوصف", height=100)
+        # استيراد بالجملة
+        st.markdown("---")
+        st.subheader("📂 استيراد معاملات بالجملة")
+        st.caption(
+            "ملف CSV أو JSON أو JSON Lines بالأعمدة: type, category, amount, date, description "
+            "أو كشف حساب بنكي بالأعمدة: date, description, debit, credit"
+        )
         
-        submitted = st.form_submit_button("💾 حفظ المعاملة", type="primary", use_container_width=True)
+        uploaded = st.file_uploader("اختر الملف", type=['csv', 'json', 'jsonl', 'ndjson'])
+        date_order = st.selectbox(
+            "صيغة التاريخ في الملف", list(DATE_ORDER_LABELS), format_func=DATE_ORDER_LABELS.get,
+            help="التواريخ التي لا تطابق الصيغة المختارة (أو ISO) تُرفض بدلاً من تخمين ترتيبها"
+        )
+        allow_new_categories = st.checkbox("السماح بفئات غير موجودة", value=True)
         
-        if submitted:
-            if amount > 0:
-                add_transaction(trans_type, category, amount, date, description)
-                st.success("✅ تم إضافة المعاملة بنجاح!")
-                st.balloons()
-            else:
-                st.error("⚠️ يرجى إدخال مبلغ أكبر من صفر")
-    
-    st.markdown('</div>', unsafe_allow_html=True)
+        if uploaded is not None and st.button("📥 استيراد", type="primary"):
+            allowed_categories = None if allow_new_categories else set(get_category_names())
+            with st.spinner("جاري الاستيراد..."):
+                with instrumentation.span('import') as info:
+                    rows, summary, rejected = prepare_import(
+                        uploaded, uploaded.name, query_transactions(), allowed_categories, date_order=date_order
+                    )
+                    import_transactions(rows)
+                    info['rows'] = summary['read']
+            
+            st.success(f"✅ تم استيراد {summary['imported']:,} معاملة من {summary['read']:,} صف")
+            if summary['duplicates']:
+                st.info(f"تم تجاهل {summary['duplicates']:,} معاملة مكررة")
+            if summary['invalid']:
+                st.warning(f"⚠️ تم رفض {summary['invalid']:,} صف غير صالح")
+                st.dataframe(rejected, use_container_width=True, hide_index=True)
+        
+        st.markdown('</div>', unsafe_allow_html=True)
+
+if pending_writes_slot is not None:
+    with pending_writes_slot:
+        render_pending_writes()
+
+# إنهاء قياس إعادة التشغيل وعرض لوحة الأداء عند تفعيلها
+perf_summary = instrumentation.finish_rerun()
+if show_debug_panel and perf_summary is not None:
+    render_debug_panel(perf_summary)
@@ -0,0 +1,124 @@
+"""تقارير وتصديرات ليلية لعدة سجلات بدون Streamlit
+
+كل مجلد يُمرر هو سجل مستقل (كما يكتبه التطبيق عند تشغيله داخل هذا المجلد)،
+ويُعالج في عملية منفصلة من مجموعة عمليات (process pool): تحميل السجل، تقرير
+الفترة (الملخص ومجاميع الفئات) كملف JSON (.report.json)، ثم تصدير معاملات الفترة بالصيغ
+المطلوبة. ملخص كل سجل يُطبع كسطر JSON على stdout.
+
+السجلات تُفتح للقراءة فقط: لا تحويل من transactions.json ولا ضغط للـ journal،
+ووضع تخزين لم يُهيأ بعد في المجلد (sqlite و shards و columnar) يُعد خطأً لهذا السجل.
+أسماء الملفات الناتجة من مسار كل سجل بالنسبة للمجلد المشترك بينها
+(a/data و b/data -> a_data و b_data).
+
+    python batch.py ledgers/* --period month --formats csv,parquet --output reports
+    python batch.py shop1 shop2 --from 2024-01-01 --to 2024-12-31 --mode sqlite --workers 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import LedgerEngine
+from exports import EXPORT_FORMATS, available_formats
+from ledger import period_bounds
+
+PERIODS = ['today', 'week', 'month', 'all']
+MODES = ['json', 'journal', 'sqlite', 'shards', 'columnar']
+DEFAULT_OUTPUT = 'reports'
+
+
+def output_names(directories):
+    """اسم ملفات كل سجل: مساره بالنسبة للمجلد المشترك بين السجلات (ValueError إذا تكرر اسم)"""
+    paths = [os.path.abspath(directory) for directory in directories]
+    root = os.path.commonpath(paths)
+    if root in paths:
+        # سجل واحد أو سجل داخل آخر: الاسم يبدأ من المجلد الأعلى
+        root = os.path.dirname(root)
+    names = [os.path.relpath(path, root).replace(os.sep, '_') for path in paths]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f"نفس اسم الملفات الناتجة لأكثر من سجل: {', '.join(duplicated)}")
+    return names
+
+
+def run_ledger(directory, name, mode, date_from, date_to, formats, output):
+    """تقرير وتصديرات سجل واحد - يعمل داخل عملية من المجموعة"""
+    started = time.perf_counter()
+    engine = LedgerEngine(directory, mode, read_only=True)
+    try:
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f'المجلد غير موجود: {directory}')
+        engine.refresh()
+        report = engine.report(date_from, date_to)
+        stem = os.path.join(output, f"{name}_{date_from or 'start'}_{date_to or 'end'}")
+        with open(stem + '.report.json', 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        files = [stem + '.report.json']
+        for fmt in formats:
+            path = f'{stem}.{EXPORT_FORMATS[fmt][2]}'
+            engine.export(path, fmt, date_from, date_to)
+            files.append(path)
+    except Exception as exc:
+        return {'ledger': directory, 'error': f'{type(exc).__name__}: {exc}'}
+    return {
+        'ledger': directory,
+        'revenue': report['revenue'],
+        'expense': report['expense'],
+        'net_profit': report['net_profit'],
+        'count': report['count'],
+        'files': files,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def run_all(directories, mode, date_from, date_to, formats, output, workers=None):
+    """معالجة السجلات بالتوازي - يرجع الملخصات بترتيب المجلدات"""
+    names = output_names(directories)
+    os.makedirs(output, exist_ok=True)
+    jobs = [
+        (directory, name, mode, date_from, date_to, formats, output)
+        for directory, name in zip(directories, names)
+    ]
+    if workers == 1 or len(jobs) == 1:
+        return [run_ledger(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_ledger, *zip(*jobs)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='تقارير وتصديرات لعدة سجلات معاملات بالتوازي')
+    parser.add_argument('ledgers', nargs='+', help='مجلدات السجلات')
+    parser.add_argument('--mode', choices=MODES, default=None, help='وضع التخزين (افتراضياً PL_STORAGE_MODE)')
+    parser.add_argument('--period', choices=PERIODS, default='month', help='الفترة إذا لم تُحدد --from/--to')
+    parser.add_argument('--from', dest='date_from', help='من تاريخ YYYY-MM-DD')
+    parser.add_argument('--to', dest='date_to', help='إلى تاريخ YYYY-MM-DD')
+    parser.add_argument('--formats', default='csv', help='صيغ التصدير مفصولة بفواصل (أو none)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='مجلد الملفات الناتجة')
+    parser.add_argument('--workers', type=int, default=None, help='عدد العمليات (افتراضياً عدد المعالجات)')
+    args = parser.parse_args(argv)
+
+    if args.date_from or args.date_to:
+        date_from, date_to = args.date_from, args.date_to
+    else:
+        date_from, date_to = period_bounds(args.period)
+
+    formats = [] if args.formats == 'none' else args.formats.split(',')
+    unavailable = [fmt for fmt in formats if fmt not in available_formats()]
+    if unavailable:
+        parser.error(f"صيغ غير متاحة: {', '.join(unavailable)}")
+
+    try:
+        results = run_all(args.ledgers, args.mode, date_from, date_to, formats, args.output, args.workers)
+    except ValueError as exc:
+        parser.error(str(exc))
+    failed = 0
+    for result in results:
+        failed += 'error' in result
+        print(json.dumps(result, ensure_ascii=False))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
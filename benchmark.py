@@ -0,0 +1,317 @@
+"""قياس أداء مراحل التطبيق على سجلات اصطناعية بأحجام مختلفة
+
+يولّد سجلات واقعية (توزيع فئات يشبه Zipf، مبالغ log-normal، تواريخ خلال
+آخر سنتين) بأحجام 10k و 100k و 1M و 10M معاملة، ويقيس كل مرحلة على حدة:
+التحميل، الحفظ، فلترة كل فترة، الإحصائيات، تجهيز بيانات الرسم، تنسيق جدول
+تبويب المعاملات، بناء فهرس البحث والبحث فيه، وتصدير تبويب التقارير. النتائج تُكتب بصيغة JSON Lines
+(سطر لكل مرحلة) لمقارنة الإصدارات ببعضها.
+
+    python benchmark.py --sizes 10k,100k --mode json
+    python benchmark.py --compare old_bench.txt bench_output.txt
+
+حجم 10M يحتاج ذاكرة كبيرة (عدة جيجابايت) في وضعي json و journal.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import storage
+from engine import LedgerEngine
+from exports import available_formats, export_buffer
+from ledger import (
+    Ledger, RunningTotals, bucket_labels, bucket_totals, calculate_stats,
+    comparison_periods, comparison_tables, display_table, lttb_indices, period_bounds, sort_page, to_frame
+)
+from search import SearchIndex
+
+SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+PERIODS = ['today', 'week', 'month', 'all']
+MODES = ['json', 'journal', 'sqlite', 'shards', 'columnar']
+# أوضاع تُقاس عبر LedgerEngine نفسه (تحميلها وحفظها داخله)
+ENGINE_MODES = ('shards', 'columnar')
+
+# الفئة -> النوع، بترتيب الشيوع (الأولى الأكثر تكراراً)
+CATEGORY_TYPES = {
+    'مبيعات': 'revenue', 'مواد خام': 'expense', 'رواتب': 'expense',
+    'خدمات': 'revenue', 'تسويق': 'expense', 'مرافق': 'expense',
+    'إيجار': 'expense', 'صيانة': 'expense', 'أخرى': 'expense',
+}
+ZIPF_EXPONENT = 1.1
+HISTORY_DAYS = 730
+DESCRIPTIONS = ['فاتورة', 'دفعة', 'طلب', 'اشتراك', 'توريد', 'عميل', 'مورد', '']
+
+DEFAULT_OUTPUT = 'bench_output.txt'
+
+
+def parse_size(text):
+    """'10k' -> 10000، '1M' -> 1000000"""
+    text = text.strip().lower()
+    for suffix, factor in (('k', 1_000), ('m', 1_000_000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(text)
+
+
+def generate_frame(n, seed=0, today=None):
+    """سجل اصطناعي من n معاملة كـ DataFrame بأعمدة ملف JSON"""
+    rng = np.random.default_rng(seed)
+    today = today or datetime.now().date()
+
+    categories = list(CATEGORY_TYPES)
+    weights = 1.0 / np.arange(1, len(categories) + 1) ** ZIPF_EXPONENT
+    codes = rng.choice(len(categories), size=n, p=weights / weights.sum())
+    category = np.array(categories, dtype=object)[codes]
+    trans_type = np.array([CATEGORY_TYPES[c] for c in categories], dtype=object)[codes]
+
+    # معاملات أكثر في الأيام الأحدث
+    age = np.minimum(rng.exponential(HISTORY_DAYS / 3, size=n), HISTORY_DAYS - 1).astype('int64')
+    dates = (pd.Timestamp(today) - pd.to_timedelta(age, unit='D')).strftime('%Y-%m-%d')
+    amount = np.round(rng.lognormal(mean=6.0, sigma=1.2, size=n), 2)
+
+    words = np.array(DESCRIPTIONS, dtype=object)[rng.integers(0, len(DESCRIPTIONS), size=n)]
+    numbers = rng.integers(1, 100_000, size=n).astype(str)
+    description = np.where(words == '', '', words + ' ' + numbers.astype(object))
+
+    df = pd.DataFrame({
+        'id': np.arange(1, n + 1),
+        'type': trans_type,
+        'category': category,
+        'amount': amount,
+        'date': dates,
+        'description': description,
+        'timestamp': dates + 'T12:00:00',
+    })
+    return df.sort_values('date', kind='mergesort', ignore_index=True)
+
+
+def write_dataset(df, mode, workdir):
+    """كتابة السجل الاصطناعي بصيغة وضع التخزين وإرجاع مسارات الملفات"""
+    paths = {
+        'snapshot': os.path.join(workdir, storage.DATA_FILE),
+        'journal': os.path.join(workdir, storage.JOURNAL_FILE),
+        'meta': os.path.join(workdir, storage.META_FILE),
+        'db': os.path.join(workdir, storage.DB_FILE),
+        'shards': os.path.join(workdir, storage.SHARDS_DIR),
+        'columnar': os.path.join(workdir, storage.COLUMNAR_FILE),
+    }
+    with open(paths['snapshot'], 'w', encoding='utf-8') as f:
+        f.write(df.to_json(orient='records', force_ascii=False))
+    if mode == 'sqlite':
+        storage.init_db(paths['db'], paths['snapshot'])
+    elif mode == 'shards':
+        storage.init_shards(paths['shards'], paths['snapshot'], paths['meta'])
+    elif mode == 'columnar':
+        columnar.init_columnar(paths['columnar'], paths['snapshot'], paths['meta'])
+    return paths
+
+
+def timed(fn, repeat):
+    """تشغيل fn عدة مرات وإرجاع (أقل زمن، الوسيط، آخر نتيجة)"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times), result
+
+
+class Stages:
+    """مراحل التطبيق لوضع تخزين واحد بنفس الدوال التي يستخدمها app.py"""
+
+    def __init__(self, mode, paths):
+        self.mode = mode
+        self.paths = paths
+        self.ledger = None
+        self.totals = None
+        self.engine = None
+
+    def load(self):
+        if self.mode in ENGINE_MODES:
+            # محرك جديد في كل مرة: الشرائح تُقرأ عند أول مرحلة تحتاجها وليس هنا
+            self.engine = LedgerEngine(os.path.dirname(self.paths['snapshot']), self.mode)
+            self.engine.refresh()
+            self.totals = self.engine.totals
+            return
+        if self.mode == 'sqlite':
+            self.totals = RunningTotals.from_groups(storage.db_daily_totals(self.paths['db']))
+            return
+        if self.mode == 'journal':
+            transactions, next_id = storage.load_journaled(self.paths['snapshot'], self.paths['journal'], self.paths['meta'])
+        else:
+            transactions = storage.read_snapshot(self.paths['snapshot'])
+            next_id = storage.next_id_after(transactions, meta_path=self.paths['meta'])
+        self.ledger = Ledger(transactions, next_id)
+        self.totals = RunningTotals.from_frame(self.ledger.between())
+
+    def save(self):
+        """حفظ معاملة واحدة جديدة بطريقة الوضع (تكلفة كل إضافة)"""
+        transaction = {
+            'type': 'revenue', 'category': 'مبيعات', 'amount': 100.0,
+            'date': datetime.now().date().isoformat(), 'description': 'benchmark',
+            'timestamp': datetime.now().isoformat()
+        }
+        if self.mode == 'sqlite':
+            storage.db_apply([('add', transaction)], self.paths['db'])
+            return
+        if self.mode in ENGINE_MODES:
+            self.engine.commit([('add', transaction)])
+            return
+        transaction = {'id': self.ledger.allocate_id(), **transaction}
+        self.ledger.add(transaction)
+        if self.mode == 'journal':
+            storage.append_events([{'op': 'add', 'transaction': transaction}],
+                                  self.paths['snapshot'], self.paths['journal'], self.paths['meta'])
+        else:
+            storage.write_meta({'next_id': self.ledger.next_id}, self.paths['meta'])
+            storage.write_snapshot(self.ledger.to_records(), self.paths['snapshot'])
+
+    def query(self, date_from=None, date_to=None):
+        if self.mode == 'sqlite':
+            return to_frame(storage.db_query(date_from, date_to, path=self.paths['db']))
+        if self.mode in ENGINE_MODES:
+            return self.engine.query(date_from, date_to)
+        return self.ledger.query(date_from, date_to)
+
+    def page(self, sort_by):
+        if self.mode == 'sqlite':
+            return to_frame(storage.db_page(sort_by=sort_by, path=self.paths['db']), sort=False)
+        if self.mode in ENGINE_MODES:
+            return self.engine.page(sort_by=sort_by)[0]
+        return sort_page(self.ledger.between(), sort_by)
+
+
+def run_size(n, mode, repeat, seed, formats):
+    """قياس كل المراحل لحجم واحد - يرجع قائمة سجلات النتائج"""
+    records = []
+
+    def record(stage, fn, rows=None, repeat=repeat):
+        best, median, result = timed(fn, repeat)
+        records.append({'stage': stage, 'rows': n, 'mode': mode, 'best_s': round(best, 6),
+                        'median_s': round(median, 6), 'repeat': repeat,
+                        'result_rows': rows(result) if rows else None})
+        print(f"  {stage:<22} {best * 1000:>12.2f} ms", file=sys.stderr)
+        return result
+
+    with tempfile.TemporaryDirectory(prefix='pl-bench-') as workdir:
+        start = time.perf_counter()
+        df = generate_frame(n, seed)
+        paths = write_dataset(df, mode, workdir)
+        del df
+        print(f"{mode} {n:,} rows (setup {time.perf_counter() - start:.1f}s)", file=sys.stderr)
+
+        stages = Stages(mode, paths)
+        record('load_transactions', stages.load)
+        # الحفظ يعيد كتابة الملف كاملاً في وضع json: مرة واحدة تكفي للأحجام الكبيرة
+        record('save_transactions', stages.save, repeat=1 if n >= 1_000_000 else repeat)
+
+        frames = {}
+        for period in PERIODS:
+            date_from, date_to = period_bounds(period)
+            frames[period] = record(f'filter_{period}', lambda: stages.query(date_from, date_to), rows=len)
+            record(f'period_stats_{period}', lambda: stages.totals.totals(date_from, date_to))
+        record('calculate_stats', lambda: calculate_stats(frames['all']))
+
+        def chart():
+            buckets = bucket_totals(frames['all'], 7, 'D')
+            return bucket_labels(buckets, 'D'), buckets['revenue'].tolist(), buckets['expense'].tolist()
+        record('chart_7d', chart)
+
+        def chart_all():
+            buckets = bucket_totals(frames['all'], 0, 'D')
+            return [lttb_indices(buckets[column].to_numpy(), 500) for column in ('revenue', 'expense')]
+        record('chart_all_lttb', chart_all)
+
+        for sort_by in ('date', 'amount'):
+            record(f'table_page_{sort_by}', lambda: display_table(stages.page(sort_by)), rows=len)
+
+        # البحث: البناء مرة واحدة عند أول بحث، ثم كل استعلام صفحة من الفهرس
+        index = record('search_index_build', lambda: SearchIndex(frames['all']), rows=len, repeat=1)
+        for stage, text in (('search_word', 'فاتوره'), ('search_prefixes', 'طلب 12')):
+            record(stage, lambda: index.search(text, limit=50), rows=lambda result: result[1])
+
+        report_from = (datetime.now().date() - timedelta(days=30)).isoformat()
+        report_to = datetime.now().date().isoformat()
+        labels, boundaries = comparison_periods('M', 60)
+        record('compare_60m', lambda: comparison_tables(stages.totals.period_matrix(boundaries), labels))
+        record('report_totals', lambda: (stages.totals.totals(report_from, report_to),
+                                         stages.totals.category_totals(report_from, report_to)))
+        report = stages.query(report_from, report_to)
+        for fmt in formats:
+            record(f'export_{fmt}', lambda: export_buffer(report, fmt).getbuffer().nbytes)
+    return records
+
+
+def git_revision():
+    """رقم الإصدار الحالي في git إن وُجد"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(path):
+    """قراءة ملف نتائج JSON Lines"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(old_path, new_path):
+    """مقارنة ملفي نتائج: النسبة > 1 تعني أن الإصدار الجديد أبطأ"""
+    key = lambda r: (r['mode'], r['rows'], r['stage'])
+    old = {key(r): r for r in load_results(old_path) if 'stage' in r}
+    new = {key(r): r for r in load_results(new_path) if 'stage' in r}
+    print(f"{'mode':<8} {'rows':>10} {'stage':<22} {'old ms':>12} {'new ms':>12} {'ratio':>7}")
+    for k in sorted(old.keys() & new.keys()):
+        before, after = old[k]['best_s'], new[k]['best_s']
+        ratio = after / before if before else float('inf')
+        print(f"{k[0]:<8} {k[1]:>10,} {k[2]:<22} {before * 1000:>12.2f} {after * 1000:>12.2f} {ratio:>7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='قياس أداء مراحل التطبيق على سجلات اصطناعية')
+    parser.add_argument('--sizes', default='10k,100k,1M,10M', help='الأحجام مفصولة بفواصل (مثل 10k,100k)')
+    parser.add_argument('--mode', choices=MODES, default='json', help='وضع التخزين')
+    parser.add_argument('--repeat', type=int, default=3, help='عدد مرات تكرار كل مرحلة')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='ملف النتائج (JSON Lines)')
+    parser.add_argument('--append', action='store_true', help='الإضافة إلى ملف النتائج بدلاً من استبداله')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='مقارنة ملفي نتائج')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    run = {
+        'run': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+    }
+    formats = available_formats()
+    with open(args.output, 'a' if args.append else 'w', encoding='utf-8') as out:
+        out.write(json.dumps(run) + '\n')
+        for n in [parse_size(s) for s in args.sizes.split(',')]:
+            for r in run_size(n, args.mode, args.repeat, args.seed, formats):
+                out.write(json.dumps({**r, 'run': run['run'], 'revision': run['revision']}) + '\n')
+                out.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""لقطة ثنائية عمودية (transactions.cols) تُربط بالذاكرة عند التحميل
+
+بدلاً من تحليل JSON وبناء dict ونص Python لكل معاملة، كل عمود مخزن كمصفوفة
+ثابتة العرض بنفس تمثيله في الذاكرة، فالتحميل يربط الملف بالذاكرة (mmap)
+ويبني الأعمدة كنوافذ عليه بدون نسخ أو تحليل:
+
+    PLCOLS1\\n | طول الترويسة (uint64) | ترويسة JSON | الأعمدة (كل منها على حد 8 بايت)
+
+- id: int64، amount: float64
+- date: ثوانٍ منذ 1970 (int64) تُقرأ كـ datetime64[s]
+- timestamp: ميكروثوانٍ (int64، NaT للفارغ) تُقرأ كـ datetime64[us]
+- type و category: رموز صحيحة (int8 و int32) وأسماؤها في الترويسة
+- description: مصفوفة مواضع (int64، عدد الصفوف + 1) ومخزن نصوص UTF-8 متصل،
+  يُقرأ كعمود نصي بدون نسخ عند توفر pyarrow
+- id_order و category_order: فهرسا الأرقام (Ledger.get) وقوائم الفئات، والمجاميع
+  اليومية في الترويسة (مثل manifest الشرائح)، فلا يُعاد فرز ولا تجميع عند التحميل
+
+التحويل لمرة واحدة من transactions.json يتم تلقائياً عند أول تشغيل بوضع
+columnar، أو مسبقاً (مفيد للسجلات الكبيرة):
+
+    python columnar.py --dir shop1
+"""
+import argparse
+import importlib.util
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import storage
+from ledger import TYPE_DTYPE, Ledger, RunningTotals
+
+# مع pyarrow يصبح مخزن النصوص عموداً نصياً بدون نسخ، وبدونها يُفك كل نص على حدة
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# وحدة التواريخ التي ينتجها to_frame في إصدار pandas الحالي (ns قبل pandas 3): عمود التاريخ
+# يُقرأ بنفس الوحدة حتى لا يُحوَّل الإطار كله عند دمجه مع ذيل المعاملات الجديدة
+_DATE_DTYPE = pd.to_datetime(pd.Series(['2000-01-01']), format='ISO8601').dtype
+
+MAGIC = b'PLCOLS1\n'
+_LENGTH = struct.Struct('<Q')
+ALIGNMENT = 8
+
+
+def _align(size):
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def _encode_descriptions(descriptions):
+    """(المواضع int64، مخزن UTF-8) لعمود الوصف"""
+    if PYARROW_AVAILABLE:
+        import pyarrow as pa
+        array = pa.array(descriptions.to_numpy(dtype=object), type=pa.large_string())
+        _, offsets, heap = array.buffers()
+        offsets = np.frombuffer(offsets, dtype='<i8', count=len(array) + 1)
+        return offsets, np.frombuffer(heap, dtype='u1', count=int(offsets[-1])) if heap is not None else b''
+    encoded = [text.encode('utf-8') for text in descriptions.tolist()]
+    offsets = np.zeros(len(encoded) + 1, dtype='<i8')
+    np.cumsum([len(text) for text in encoded], out=offsets[1:])
+    return offsets, b''.join(encoded)
+
+
+def _decode_descriptions(offsets, heap, index):
+    """عمود الوصف من المواضع والمخزن"""
+    if PYARROW_AVAILABLE:
+        import pyarrow as pa
+        array = pa.LargeStringArray.from_buffers(len(offsets) - 1, pa.py_buffer(offsets), pa.py_buffer(heap))
+        # pandas 3 يبقي النصوص في مخزن Arrow كما هو، والإصدارات الأقدم تحولها إلى object
+        return pd.Series(array.to_pandas(), index=index)
+    heap = bytes(heap)
+    starts, ends = offsets[:-1].tolist(), offsets[1:].tolist()
+    return pd.Series([heap[a:b].decode('utf-8') for a, b in zip(starts, ends)], index=index, dtype=object)
+
+
+def write_columnar(frame, next_id, daily, path=storage.COLUMNAR_FILE):
+    """كتابة المعاملات (DataFrame بأعمدة to_frame) ومجاميعها اليومية (RunningTotals.groups) في ملف مؤقت
+
+    يرجع مسار الملف المؤقت لاعتماده بـ replace_columnar.
+    """
+    frame = frame.reset_index(drop=True)
+    categories = frame['category'].cat.categories.astype(str).tolist()
+    offsets, heap = _encode_descriptions(frame['description'].fillna('').astype(str))
+    columns = {
+        'id': frame['id'].to_numpy(dtype='<i8'),
+        'type': frame['type'].astype(TYPE_DTYPE).cat.codes.to_numpy(dtype='<i1'),
+        'category': frame['category'].cat.codes.to_numpy(dtype='<i4'),
+        'amount': frame['amount'].to_numpy(dtype='<f8'),
+        'date': frame['date'].to_numpy(dtype='datetime64[s]').view('<i8'),
+        'timestamp': frame['timestamp'].to_numpy(dtype='datetime64[us]').view('<i8'),
+        'description_offsets': offsets,
+        'description_heap': np.frombuffer(heap, dtype='u1') if isinstance(heap, bytes) else heap,
+        'id_order': np.argsort(frame['id'].to_numpy(), kind='stable').astype('<i8'),
+        'category_order': np.argsort(frame['category'].cat.codes.to_numpy(), kind='stable').astype('<i8'),
+    }
+
+    # المواضع في الترويسة من بداية منطقة الأعمدة (أول حد 8 بايت بعد الترويسة)
+    layout, position = {}, 0
+    for name, values in columns.items():
+        layout[name] = [position, values.dtype.str, len(values)]
+        position = _align(position + values.nbytes)
+    header = {
+        'rows': len(frame), 'next_id': next_id, 'categories': categories, 'columns': layout,
+        'daily': [list(group) for group in daily],
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    start = _align(len(MAGIC) + _LENGTH.size + len(header_bytes))
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(_LENGTH.pack(len(header_bytes)))
+        f.write(header_bytes)
+        for name, values in columns.items():
+            f.seek(start + layout[name][0])
+            f.write(memoryview(np.ascontiguousarray(values)).cast('B'))
+        f.truncate(position + start)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+
+def replace_columnar(tmp_path, path=storage.COLUMNAR_FILE, exclusive=False):
+    """اعتماد لقطة مكتوبة بـ write_columnar مكان الحالية
+
+    exclusive: فقط إذا لم توجد لقطة (التحويل الأول من عدة عمليات معاً)،
+    ويرجع False إذا سبقتنا إليه عملية أخرى.
+    """
+    if exclusive:
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    storage._fsync_dir(path)
+    return True
+
+
+def save_columnar(frame, next_id, daily, path=storage.COLUMNAR_FILE):
+    """كتابة اللقطة العمودية واستبدال الحالية"""
+    replace_columnar(write_columnar(frame, next_id, daily, path), path)
+
+
+def read_columnar(path=storage.COLUMNAR_FILE):
+    """(DataFrame بأعمدة to_frame، الترويسة) من اللقطة العمودية، أو None إذا لم توجد
+
+    الترويسة فيها next_id والمجاميع اليومية daily، ومصفوفتا id_order و category_order
+    من الملف (None في اللقطات الأقدم التي لا تحملها).
+
+    الأعمدة نوافذ على الملف المربوط بالذاكرة، وصفحاته تُقرأ من القرص عند أول
+    وصول إليها. ويندوز لا يسمح باستبدال ملف مربوط، فتُقرأ هناك إلى الذاكرة.
+    """
+    try:
+        if os.name == 'nt':
+            data = np.fromfile(path, dtype='u1')
+        else:
+            data = np.memmap(path, dtype='u1', mode='r')
+    except FileNotFoundError:
+        return None
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f'{path} ليس لقطة عمودية')
+    (length,) = _LENGTH.unpack(bytes(data[len(MAGIC):len(MAGIC) + _LENGTH.size]))
+    start = len(MAGIC) + _LENGTH.size
+    header = json.loads(bytes(data[start:start + length]))
+    start = _align(start + length)
+
+    def column(name):
+        offset, dtype, count = header['columns'][name]
+        offset, dtype = start + offset, np.dtype(dtype)
+        return data[offset:offset + count * dtype.itemsize].view(dtype)
+
+    index = pd.RangeIndex(header['rows'])
+    dates = column('date').view('datetime64[s]')
+    if dates.dtype != _DATE_DTYPE:
+        dates = dates.astype(_DATE_DTYPE)
+    frame = pd.DataFrame({
+        'id': pd.Series(column('id'), index=index, copy=False),
+        'type': pd.Categorical.from_codes(column('type'), dtype=TYPE_DTYPE),
+        'category': pd.Categorical.from_codes(column('category'), categories=header['categories']),
+        'amount': pd.Series(column('amount'), index=index, copy=False),
+        'date': pd.Series(dates, index=index, copy=False),
+        'description': _decode_descriptions(column('description_offsets'), column('description_heap'), index),
+        'timestamp': pd.Series(column('timestamp').view('datetime64[us]'), index=index, copy=False),
+    }, copy=False)
+    for name in ('id_order', 'category_order'):
+        header[name] = column(name) if name in header['columns'] else None
+    return frame, header
+
+
+def load_columnar(path=storage.COLUMNAR_FILE):
+    """(Ledger، RunningTotals) من اللقطة العمودية بدون فرز أو تجميع"""
+    frame, header = read_columnar(path)
+    ledger = Ledger.from_frame(frame, header['next_id'], header['id_order'], header['category_order'])
+    return ledger, RunningTotals.from_groups(header['daily'])
+
+
+def init_columnar(path=storage.COLUMNAR_FILE, json_path=storage.DATA_FILE, meta_path=storage.META_FILE):
+    """تحويل transactions.json إلى لقطة عمودية عند أول تشغيل - يرجع عدد المعاملات أو None إذا وُجدت اللقطة"""
+    if os.path.exists(path):
+        return None
+    transactions = storage.read_snapshot(json_path)
+    ledger = Ledger(transactions, storage.next_id_after(transactions, meta_path=meta_path))
+    frame = ledger.between()
+    daily = RunningTotals.from_frame(frame).groups()
+    replace_columnar(write_columnar(frame, ledger.next_id, daily, path), path, exclusive=True)
+    return len(ledger)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='تحويل transactions.json إلى لقطة عمودية (transactions.cols)')
+    parser.add_argument('--dir', default='', help='مجلد السجل (افتراضياً المجلد الحالي)')
+    parser.add_argument('--force', action='store_true', help='إعادة التحويل حتى لو وُجدت لقطة عمودية')
+    args = parser.parse_args(argv)
+
+    path = os.path.join(args.dir, storage.COLUMNAR_FILE)
+    json_path = os.path.join(args.dir, storage.DATA_FILE)
+    meta_path = os.path.join(args.dir, storage.META_FILE)
+    with storage.file_lock(os.path.join(args.dir, storage.LOCK_FILE)):
+        if args.force and os.path.exists(path):
+            os.remove(path)
+        start = time.perf_counter()
+        rows = init_columnar(path, json_path, meta_path)
+    if rows is None:
+        print(f'{path} موجود بالفعل (استخدم --force لإعادة التحويل)', file=sys.stderr)
+        return 1
+    print(f'{rows:,} معاملة -> {path} ({time.perf_counter() - start:.2f} ث)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
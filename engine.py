@@ -0,0 +1,591 @@
+"""محرك السجل بدون واجهة: التحميل والفلترة والإحصائيات والتقارير والكتابة
+
+كل سجل معاملات يعيش في مجلد (transactions.json أو transactions.journal أو
+transactions.db أو transactions.shards/ أو transactions.cols بحسب وضع
+التخزين)، و LedgerEngine يحمله في الذاكرة ويبقيه متزامناً مع القرص. لا يعتمد على Streamlit: نفس الكود يخدم التطبيق (محرك
+واحد مشترك بين كل الجلسات) وأداة الدفعات batch.py (محرك لكل سجل في عملية
+منفصلة).
+"""
+import os
+import threading
+
+import columnar
+import instrumentation
+import storage
+from exports import write_export
+from ledger import (
+    Ledger, RunningTotals, comparison_periods, comparison_tables, concat_frames, sort_page, summarize,
+    to_frame, to_records
+)
+from search import SearchIndex
+
+
+class LedgerEngine:
+    """سجل معاملات واحد في مجلد directory ومجاميعه المحسوبة مسبقاً"""
+
+    def __init__(self, directory='', mode=None, read_only=False):
+        self.directory = directory
+        self.mode = mode or storage.STORAGE_MODE
+        # للقراءة فقط (batch.py): لا تحويل من transactions.json ولا ضغط للـ journal
+        self.read_only = read_only
+        self.data_file = os.path.join(directory, storage.DATA_FILE)
+        self.journal_file = os.path.join(directory, storage.JOURNAL_FILE)
+        self.db_file = os.path.join(directory, storage.DB_FILE)
+        self.meta_file = os.path.join(directory, storage.META_FILE)
+        self.lock_file = os.path.join(directory, storage.LOCK_FILE)
+        self.shards_dir = os.path.join(directory, storage.SHARDS_DIR)
+        self.columnar_file = os.path.join(directory, storage.COLUMNAR_FILE)
+        self.categories_file = os.path.join(directory, storage.CATEGORIES_FILE)
+        self.lock = threading.RLock()
+        self.signature = None
+        self.ledger = None
+        self.totals = None
+        # فهرس البحث في الوصف والفئة: يُبنى عند أول بحث ويُحدَّث مع كل عملية
+        self.index = None
+        # سجل أسماء الفئات (categories.json) وبصمة ملفه
+        self.category_registry = []
+        self._categories_signature = False
+        # وضع shards: الـ manifest الحالي والشرائح المحملة {الشهر: (اسم الملف، Ledger)}
+        self.manifest = None
+        self._shards = {}
+        # عمليات طُبقت في الذاكرة ولم تُحفظ بعد: عددها وأحداثها والأشهر المعدلة
+        self.pending = 0
+        self.applied = 0
+        self._events = []
+        self._dirty = set()
+
+    @property
+    def name(self):
+        return os.path.basename(os.path.abspath(self.directory))
+
+    @property
+    def version(self):
+        """يتغير مع كل تغيير في البيانات: على القرص (البصمة) أو في الذاكرة قبل حفظه"""
+        return self.signature, self.applied
+
+    def data_signature(self):
+        return storage.data_signature(
+            self.mode, self.data_file, self.journal_file, self.db_file, self.shards_dir, self.columnar_file
+        )
+
+    # ---- القراءة ----
+
+    def _build_state(self):
+        """قراءة البيانات من التخزين وبناء السجل والمجاميع"""
+        if self.mode == 'sqlite':
+            # لا يتم تحميل السجل كاملاً: كل استعلام يجلب الصفوف التي يحتاجها فقط
+            with instrumentation.span('build_totals') as info:
+                totals = RunningTotals.from_groups(storage.db_daily_totals(self.db_file))
+                info['rows'] = len(totals.by_day_category)
+            return None, totals
+
+        if self.mode == 'shards':
+            # المجاميع من الـ manifest وحده: الشرائح تُقرأ عند أول استعلام يحتاجها
+            with instrumentation.span('read_storage') as info:
+                manifest = storage.read_manifest(self.shards_dir)
+                info['rows'] = sum(entry['rows'] for entry in manifest['shards'].values())
+            with instrumentation.span('build_totals'):
+                totals = RunningTotals.from_groups(
+                    group for entry in manifest['shards'].values() for group in entry['daily']
+                )
+            # الشرائح التي لم يتغير ملفها تبقى محملة
+            self._shards = {
+                month: cached for month, cached in self._shards.items()
+                if month in manifest['shards'] and manifest['shards'][month]['file'] == cached[0]
+            }
+            self.manifest = manifest
+            return None, totals
+
+        if self.mode == 'columnar':
+            # الأعمدة نوافذ على الملف المربوط بالذاكرة، وفهرس الأرقام والمجاميع
+            # اليومية محفوظة معها: لا تحليل ولا فرز ولا تجميع
+            with instrumentation.span('read_storage') as info:
+                ledger, totals = columnar.load_columnar(self.columnar_file)
+                info['rows'] = len(ledger)
+            return ledger, totals
+
+        with instrumentation.span('read_storage') as info:
+            if self.mode == 'journal':
+                transactions, next_id = storage.load_journaled(
+                    self.data_file, self.journal_file, self.meta_file, read_only=self.read_only
+                )
+            else:
+                transactions = storage.read_snapshot(self.data_file)
+                next_id = storage.next_id_after(transactions, meta_path=self.meta_file)
+            info['rows'] = len(transactions)
+        with instrumentation.span('build_frame') as info:
+            ledger = Ledger(transactions, next_id)
+            info['rows'] = len(ledger)
+        with instrumentation.span('build_totals'):
+            totals = RunningTotals.from_frame(ledger.between())
+        return ledger, totals
+
+    def _require_storage(self):
+        """وضع القراءة فقط: خطأ بدلاً من التحويل إذا لم يُهيأ وضع التخزين في المجلد بعد"""
+        path = {
+            'sqlite': self.db_file,
+            'shards': os.path.join(self.shards_dir, storage.MANIFEST_FILE),
+            'columnar': self.columnar_file,
+        }.get(self.mode)
+        if path is not None and not os.path.exists(path):
+            raise FileNotFoundError(
+                f'وضع {self.mode} غير مهيأ: {path} غير موجود (يُنشأ عند تشغيل التطبيق بهذا الوضع)'
+            )
+
+    def refresh(self):
+        """إعادة التحميل فقط إذا تغيرت البيانات على القرص - يرجع True إذا كانت الذاكرة صالحة"""
+        if self.read_only:
+            self._require_storage()
+        elif self.mode == 'journal' and self.signature != self.data_signature():
+            # يأخذ قفل الملف، فيُستدعى قبل قفل الذاكرة (نفس ترتيب flush)
+            storage.init_journal(self.data_file, self.journal_file, self.meta_file)
+        with self.lock:
+            if self.mode == 'sqlite' and not self.read_only:
+                storage.init_db(self.db_file, self.data_file)
+            elif self.mode == 'shards' and not self.read_only:
+                storage.init_shards(self.shards_dir, self.data_file, self.meta_file)
+            elif self.mode == 'columnar' and not self.read_only:
+                columnar.init_columnar(self.columnar_file, self.data_file, self.meta_file)
+            # البصمة تُقرأ قبل التحميل: أي تغيير أثناء التحميل يؤدي لإعادة التحميل في المرة التالية
+            signature = self.data_signature()
+            if self.signature == signature:
+                return True
+            if self.pending:
+                # الذاكرة تحمل عمليات لم تُحفظ: تغييرات العمليات الأخرى تُدمج عند الحفظ التالي
+                return True
+            self.ledger, self.totals = self._build_state()
+            self.index = None
+            self.signature = signature
+            return False
+
+    def _shard(self, month):
+        """سجل شريحة شهر واحد - يُقرأ من القرص عند أول حاجة إليه"""
+        entry = self.manifest['shards'].get(month)
+        cached = self._shards.get(month)
+        if cached is not None and (entry is None or cached[0] == entry['file']):
+            return cached[1]
+        if entry is None:
+            return Ledger()
+        try:
+            with instrumentation.span('read_shard', month=month) as info:
+                shard = Ledger(storage.read_shard(entry, self.shards_dir))
+                info['rows'] = len(shard)
+        except FileNotFoundError:
+            # عملية أخرى استبدلت الشريحة بعد قراءتنا للـ manifest: نعيد قراءته
+            if self.refresh():
+                raise
+            return self._shard(month)
+        self._shards[month] = (entry['file'], shard)
+        return shard
+
+    def _months(self, date_from=None, date_to=None):
+        """أشهر الشرائح التي تتقاطع مع الفترة مرتبة تصاعدياً"""
+        first = None if date_from is None else storage.shard_month(date_from)
+        last = None if date_to is None else storage.shard_month(date_to)
+        return [
+            month for month in sorted(self.manifest['shards'].keys() | self._dirty)
+            if (first is None or month >= first) and (last is None or month <= last)
+        ]
+
+    def _month_count(self, month, trans_type=None, category=None):
+        """عدد معاملات شريحة المطابقة للفلاتر من مجاميعها اليومية في الـ manifest"""
+        if month in self._dirty:
+            return len(self._shard(month).query(trans_type=trans_type, category=category))
+        return sum(
+            count for _, t, c, _, count in self.manifest['shards'][month]['daily']
+            if (trans_type is None or t == trans_type) and (category is None or c == category)
+        )
+
+    def query(self, date_from=None, date_to=None, trans_type=None, category=None):
+        """المعاملات المطابقة للفلاتر كـ DataFrame مرتب حسب التاريخ (الحدود شاملة)"""
+        if self.mode == 'sqlite':
+            return to_frame(storage.db_query(date_from, date_to, trans_type, category, self.db_file))
+        if self.mode == 'shards':
+            return concat_frames(
+                self._shard(month).query(date_from, date_to, trans_type, category)
+                for month in self._months(date_from, date_to)
+            )
+        return self.ledger.query(date_from, date_to, trans_type, category)
+
+    def page(self, trans_type=None, category=None, sort_by='date', descending=True, offset=0, limit=50, text=None):
+        """صفحة من المعاملات المرتبة وعدد كل المعاملات المطابقة (وللنص text إذا حُدد)"""
+        if text:
+            # الفهرس يرجع أرقام الصفحة بعد الفلترة والترتيب: تُجلب صفوفها فقط
+            ids, total = self._search_index().search(text, trans_type, category, sort_by, descending, offset, limit)
+            return to_frame([self.get(trans_id) for trans_id in ids], sort=False), total
+        if self.mode == 'sqlite':
+            rows = storage.db_page(trans_type, category, sort_by, descending, offset, limit, self.db_file)
+            return to_frame(rows, sort=False), storage.db_count(trans_type, category, self.db_file)
+        if self.mode == 'shards' and sort_by == 'date':
+            # الترتيب بالتاريخ يقرأ الشرائح من طرف الترتيب حتى تكتمل الصفحة فقط،
+            # والأشهر التي تقع كلها قبل الإزاحة تُتخطى بعددها في الـ manifest
+            months = self._months()
+            if descending:
+                months.reverse()
+            frames, skip, rows = [], offset, 0
+            for month in months:
+                if rows - skip >= limit:
+                    break
+                count = self._month_count(month, trans_type, category)
+                if not frames and skip >= count:
+                    skip -= count
+                    continue
+                frames.append(self._shard(month).query(trans_type=trans_type, category=category))
+                rows += count
+            if descending:
+                frames.reverse()
+            page = sort_page(concat_frames(frames), sort_by, descending, skip, limit)
+            return page, self.totals.count(trans_type, category)
+        filtered = self.query(trans_type=trans_type, category=category)
+        return sort_page(filtered, sort_by, descending, offset, limit), len(filtered)
+
+    def get(self, trans_id):
+        """معاملة واحدة بالرقم أو None"""
+        if self.mode == 'sqlite':
+            return storage.db_get(trans_id, self.db_file)
+        if self.mode == 'shards':
+            month = self._month_of(trans_id)
+            return None if month is None else self._shard(month).get(trans_id)
+        return self.ledger.get(trans_id)
+
+    def _month_of(self, trans_id):
+        """شهر الشريحة التي تحتوي الرقم أو None - يُبحث فقط في الشرائح التي يقع الرقم في مداها"""
+        candidates = [
+            month for month, entry in list(self.manifest['shards'].items())
+            if entry['min_id'] <= trans_id <= entry['max_id']
+        ]
+        for month in candidates + sorted(self._dirty.difference(candidates)):
+            if self._shard(month).get(trans_id) is not None:
+                return month
+        return None
+
+    def _search_index(self):
+        """فهرس البحث - يُبنى من كل المعاملات عند أول استخدام"""
+        with self.lock:
+            if self.index is None:
+                with instrumentation.span('build_search_index') as info:
+                    self.index = SearchIndex(self.query())
+                    info['rows'] = len(self.index)
+            return self.index
+
+    def search(self, text, trans_type=None, category=None, limit=20):
+        """معاملات تحتوي كلمات وصفها أو فئتها على كل كلمات text (كبادئات)، الأحدث أولاً"""
+        ids, _ = self._search_index().search(text, trans_type, category, limit=limit)
+        return [self.get(trans_id) for trans_id in ids]
+
+    def has_transactions(self):
+        if self.mode == 'sqlite':
+            return storage.db_has_transactions(self.db_file)
+        if self.mode == 'shards':
+            return self.totals.count() > 0
+        return len(self.ledger) > 0
+
+    def categories(self):
+        """الفئات المستخدمة في المعاملات (من المجاميع بدون المرور على المعاملات)"""
+        return sorted({category for category, _ in list(self.totals.by_category)})
+
+    def _load_categories(self):
+        """قراءة سجل الفئات إذا تغير ملفه (أضافت عملية أخرى فئة)"""
+        signature = storage.categories_signature(self.categories_file)
+        if signature != self._categories_signature:
+            self.category_registry = storage.read_categories(self.categories_file)
+            self._categories_signature = signature
+        return self.category_registry
+
+    def category_names(self):
+        """فئات السجل بترتيب إضافتها، ثم أي فئة في المعاملات لم تُسجل بعد (عمليات معلقة)"""
+        names = self._load_categories()
+        known = set(names)
+        return names + [category for category in self.categories() if category not in known]
+
+    def add_category(self, name):
+        """تسجيل فئة جديدة في سجل الفئات (لا شيء إذا وُجدت) وإرجاع السجل كاملاً"""
+        with storage.file_lock(self.lock_file), self.lock:
+            storage.register_categories([name], self.categories_file)
+            return list(self._load_categories())
+
+    def _register_categories(self):
+        """تسجيل الفئات الجديدة في المعاملات المحفوظة (تحت قفل الملف بعد الكتابة)"""
+        known = set(self._load_categories())
+        new = [category for category in self.categories() if category not in known]
+        if new:
+            storage.register_categories(new, self.categories_file)
+            self._load_categories()
+
+    def period_stats(self, date_from=None, date_to=None):
+        """(الإيرادات، المصروفات، صافي الربح، نسبة الربح، العدد) من المجاميع البادئة"""
+        total_revenue, total_expense, count = self.totals.totals(date_from, date_to)
+        return summarize(total_revenue, total_expense) + (count,)
+
+    def report(self, date_from=None, date_to=None):
+        """تقرير فترة: الملخص ومجاميع كل فئة بدون المرور على المعاملات"""
+        total_revenue, total_expense, net_profit, profit_margin, count = self.period_stats(date_from, date_to)
+        category_totals = self.totals.category_totals(date_from, date_to)
+        return {
+            'ledger': self.name,
+            'from': date_from,
+            'to': date_to,
+            'revenue': total_revenue,
+            'expense': total_expense,
+            'net_profit': round(net_profit, 2),
+            'profit_margin': round(profit_margin, 2),
+            'count': count,
+            'categories': {
+                category: {
+                    'revenue': category_totals.get((category, 'revenue'), 0.0),
+                    'expense': category_totals.get((category, 'expense'), 0.0),
+                }
+                for category in sorted({category for category, _ in category_totals})
+            },
+        }
+
+    def comparison(self, freq='M', periods=12, today=None):
+        """مقارنة آخر periods شهراً/ربعاً: جدول الملخص وجدول الفئات × الفترات"""
+        labels, boundaries = comparison_periods(freq, periods, today)
+        return comparison_tables(self.totals.period_matrix(boundaries), labels)
+
+    def export(self, path, fmt, date_from=None, date_to=None):
+        """كتابة معاملات الفترة إلى ملف بصيغة fmt - يرجع عدد الصفوف"""
+        frame = self.query(date_from, date_to)
+        with instrumentation.span('export', format=fmt, rows=len(frame)), open(path, 'wb') as f:
+            write_export(frame, fmt, f)
+        return len(frame)
+
+    # ---- الكتابة ----
+    #
+    # الكتابة مرحلتان: apply تطبق العمليات على السجل والمجاميع في الذاكرة
+    # وتسجلها كمعلقة، و flush تحفظ المعلقات على القرص. commit تنفذ المرحلتين
+    # معاً تحت قفل الملف (الكتابة المتزامنة)، و DebouncedWriter ينفذ apply
+    # فوراً و flush لاحقاً في الخلفية (الكتابة غير المتزامنة).
+
+    def _allocate_ids(self, count=1):
+        """أول رقم من count أرقام جديدة متتالية"""
+        if self.mode == 'shards':
+            first = self.manifest['next_id']
+            self.manifest['next_id'] += count
+        else:
+            first = self.ledger.next_id
+            self.ledger.next_id += count
+        return first
+
+    def _shard_for_write(self, month):
+        """شريحة الشهر للتعديل (جديدة إذا لم توجد) مع تسجيلها كمعدلة"""
+        if month not in self._dirty:
+            shard = self._shard(month)
+            if month not in self.manifest['shards']:
+                self._shards[month] = (None, shard)
+            self._dirty.add(month)
+        return self._shards[month][1]
+
+    def _apply_operation(self, op, payload):
+        """تطبيق عملية واحدة على السجل والمجاميع في الذاكرة وإرجاع نتيجتها"""
+        totals = self.totals
+        if op == 'add':
+            transaction = {'id': self._allocate_ids(), **payload}
+            if self.mode == 'shards':
+                self._shard_for_write(storage.shard_month(transaction['date'])).add(transaction)
+            else:
+                self.ledger.add(transaction)
+            totals.add(transaction['date'], transaction['type'], transaction['category'], transaction['amount'])
+            if self.index is not None:
+                self.index.add(transaction)
+            self._events.append({'op': 'add', 'transaction': transaction})
+            return transaction['id']
+
+        if op == 'delete':
+            if self.mode == 'shards':
+                month = self._month_of(payload)
+                removed = None if month is None else self._shard_for_write(month).delete(payload)
+            else:
+                removed = self.ledger.delete(payload)
+            if removed is not None:
+                totals.remove(removed['date'], removed['type'], removed['category'], removed['amount'])
+                if self.index is not None:
+                    self.index.remove(payload)
+                self._events.append({'op': 'delete', 'id': payload})
+            return removed
+
+        # import: دفعة معاملات بأرقام متتالية
+        first_id = self._allocate_ids(len(payload))
+        transactions = [{'id': first_id + i, **t} for i, t in enumerate(payload)]
+        if self.mode == 'shards':
+            by_month = {}
+            for t in transactions:
+                by_month.setdefault(storage.shard_month(t['date']), []).append(t)
+            for month, rows in by_month.items():
+                self._shard_for_write(month).extend(rows)
+        else:
+            self.ledger.extend(transactions)
+        frame = to_frame(transactions)
+        totals.add_frame(frame)
+        if self.index is not None:
+            self.index.add_frame(frame)
+        self._events.extend({'op': 'add', 'transaction': t} for t in transactions)
+        return len(transactions)
+
+    def apply(self, operations):
+        """تطبيق دفعة عمليات ('add' | 'delete' | 'import', payload) في الذاكرة فقط - يرجع نتيجة كل عملية
+
+        العمليات تبقى معلقة حتى flush. غير متاح في وضع sqlite: الكتابة هناك داخل القاعدة.
+        """
+        with self.lock:
+            results = [self._apply_operation(op, payload) for op, payload in operations]
+            self.pending += len(operations)
+            self.applied += 1
+        return results
+
+    def _replay_pending(self):
+        """إعادة التحميل من القرص (كتبت عملية أخرى) ثم إعادة تطبيق الأحداث المعلقة فوقه
+
+        الإضافات تأخذ أرقاماً جديدة حتى لا تتعارض مع أرقام العملية الأخرى.
+        """
+        events, pending = self._events, self.pending
+        self._events, self._dirty, self.pending = [], set(), 0
+        self._shards = {}
+        self.signature = None
+        self.refresh()
+        new_ids = {}
+        for event in events:
+            if event['op'] == 'add':
+                transaction = event['transaction']
+                payload = {key: value for key, value in transaction.items() if key != 'id'}
+                new_ids[transaction['id']] = self._apply_operation('add', payload)
+            else:
+                self._apply_operation('delete', new_ids.get(event['id'], event['id']))
+        self.pending = pending
+
+    def _take_pending(self):
+        """التقاط المعلقات تحت القفل وإرجاع دالة تكتبها على القرص بدونه
+
+        القيم الملتقطة نسخ أو إطارات لا تُعدل في مكانها (الإضافة والحذف ينشئان إطاراً
+        جديداً)، فالعمليات التي تُطبق أثناء الكتابة تبقى معلقة للمرة التالية ولا تغير
+        ما يُكتب الآن. التحويل إلى سجلات JSON (O(n)) يتم في write خارج القفل.
+        """
+        events, dirty, count = self._events, self._dirty, self.pending
+        self._events, self._dirty, self.pending = [], set(), 0
+
+        def restore():
+            # فشلت الكتابة: المعلقات تعود لتُحفظ في المحاولة التالية
+            self._events = events + self._events
+            self._dirty |= dirty
+            self.pending += count
+
+        if self.mode == 'journal':
+            def write():
+                if events:
+                    storage.append_events(events, self.data_file, self.journal_file, self.meta_file)
+        elif self.mode == 'json':
+            meta, frame = {'next_id': self.ledger.next_id}, self.ledger.between()
+
+            def write():
+                storage.write_meta(meta, self.meta_file)
+                storage.write_snapshot(to_records(frame), self.data_file)
+        elif self.mode == 'columnar':
+            frame, next_id, daily = self.ledger.between(), self.ledger.next_id, self.totals.groups()
+
+            def write():
+                columnar.save_columnar(frame, next_id, daily, self.columnar_file)
+        else:
+            manifest = {**self.manifest, 'shards': dict(self.manifest['shards'])}
+            frames = {month: self._shard(month).between() for month in dirty}
+
+            def write():
+                return self._write_shards(manifest, {month: to_records(frame) for month, frame in frames.items()})
+        return write, restore, count
+
+    def _write_shards(self, manifest, shards):
+        """كتابة الشرائح المعدلة في ملفات جيل جديد ثم الـ manifest - يرجع الـ manifest المكتوب"""
+        generation = manifest['generation'] + 1
+        manifest['generation'] = generation
+        current = storage.current_month()
+        for month, records in sorted(shards.items()):
+            if records:
+                manifest['shards'][month] = storage.write_shard(
+                    month, records, month < current, generation, self.shards_dir
+                )
+            else:
+                manifest['shards'].pop(month, None)
+        storage.archive_closed_shards(manifest, current, self.shards_dir)
+        storage.write_manifest(manifest, self.shards_dir)
+        return manifest
+
+    def _written(self, manifest):
+        """اعتماد الـ manifest المكتوب مع الإبقاء على ما طُبق في الذاكرة بعد التقاطه"""
+        next_id = max(manifest['next_id'], self.manifest['next_id'])
+        self.manifest = {**manifest, 'next_id': next_id}
+        for month in list(self._shards):
+            entry = manifest['shards'].get(month)
+            if entry is not None:
+                self._shards[month] = (entry['file'], self._shards[month][1])
+            elif month not in self._dirty:
+                del self._shards[month]
+
+    def flush(self):
+        """حفظ العمليات المعلقة بكتابة واحدة تحت قفل الملف - يرجع عددها"""
+        with storage.file_lock(self.lock_file):
+            with self.lock:
+                if not self.pending:
+                    return 0
+                if self.data_signature() != self.signature:
+                    self._replay_pending()
+                write, restore, count = self._take_pending()
+            with instrumentation.span('flush', operations=count):
+                try:
+                    written = write()
+                except Exception:
+                    with self.lock:
+                        restore()
+                    raise
+            with self.lock:
+                if self.mode == 'shards':
+                    self._written(written)
+                self.signature = self.data_signature()
+                self._register_categories()
+        return count
+
+    def commit(self, operations):
+        """حفظ دفعة عمليات ('add' | 'delete' | 'import', payload) بكتابة واحدة - يرجع نتيجة كل عملية"""
+        with instrumentation.span('commit', operations=len(operations)), storage.file_lock(self.lock_file), self.lock:
+            # عملية أخرى كتبت منذ آخر تحميل: نعيد التحميل أولاً حتى لا نكتب فوق معاملاتها
+            self.refresh()
+            try:
+                if self.mode == 'sqlite':
+                    results = storage.db_apply(operations, self.db_file)
+                    for (op, payload), result in zip(operations, results):
+                        if op == 'add':
+                            self.totals.add(payload['date'], payload['type'], payload['category'], payload['amount'])
+                            if self.index is not None:
+                                self.index.add({'id': result, **payload})
+                        elif op == 'delete':
+                            for t in result:
+                                self.totals.remove(t['date'], t['type'], t['category'], t['amount'])
+                                if self.index is not None:
+                                    self.index.remove(t['id'])
+                        else:
+                            self.totals.add_frame(to_frame({'id': 0, **t} for t in payload))
+                            # أرقام الدفعة تحددها القاعدة: الفهرس يُبنى من جديد عند البحث التالي
+                            self.index = None
+                    self.applied += 1
+                else:
+                    results = self.apply(operations)
+                    write, _, _ = self._take_pending()
+                    written = write()
+                    if self.mode == 'shards':
+                        self._written(written)
+            except Exception:
+                # الذاكرة قد تختلف عن القرص الآن: إعادة التحميل في المرة التالية
+                self.signature = None
+                self._events, self._dirty, self.pending = [], set(), 0
+                self._shards = {}
+                self.index = None
+                raise
+            self.signature = self.data_signature()
+            self._register_categories()
+        return results
+
+
+def make_writer(engine):
+    """خيط الكتابة المشترك للمحرك حسب الإعدادات: غير متزامن (PL_ASYNC_WRITES) أو حفظ مجمع"""
+    if storage.ASYNC_WRITES and engine.mode != 'sqlite':
+        return storage.DebouncedWriter(engine.apply, engine.flush, lambda: engine.pending)
+    return storage.GroupCommitWriter(engine.commit)
@@ -0,0 +1,128 @@
+"""تصدير التقارير على دفعات
+
+كل صيغة تُكتب إلى المخزن على دفعات من الصفوف بدلاً من بناء النص الكامل
+ثم ترميزه، ولا يتم إنشاء أي ملف إلا للصيغة التي يطلبها المستخدم.
+"""
+import importlib.util
+import io
+
+from ledger import format_timestamps
+
+# Parquet و Arrow IPC يحتاجان pyarrow (مثبتة عادة مع Streamlit)، وتُستورد
+# عند أول تصدير بهاتين الصيغتين فقط حتى لا تبطئ بدء الجلسة
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+EXPORT_CHUNK_ROWS = 50_000
+
+# الصيغة -> (التسمية، نوع MIME، امتداد الملف)
+EXPORT_FORMATS = {
+    'csv': ('CSV', 'text/csv', 'csv'),
+    'json': ('JSON', 'application/json', 'json'),
+    'parquet': ('Parquet', 'application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('Arrow', 'application/vnd.apache.arrow.file', 'arrow'),
+}
+
+
+def available_formats():
+    """الصيغ المتاحة في البيئة الحالية"""
+    if PYARROW_AVAILABLE:
+        return list(EXPORT_FORMATS)
+    return ['csv', 'json']
+
+
+def iter_chunks(df, rows=EXPORT_CHUNK_ROWS):
+    """تقسيم الجدول إلى دفعات مع تحويل الأعمدة لصيغة التصدير"""
+    for start in range(0, len(df), rows):
+        chunk = df.iloc[start:start + rows]
+        yield chunk.assign(
+            type=chunk['type'].astype(str),
+            category=chunk['category'].astype(str),
+            date=chunk['date'].dt.strftime('%Y-%m-%d'),
+            timestamp=format_timestamps(chunk['timestamp'])
+        )
+
+
+def _write_csv(df, f):
+    f.write('\ufeff'.encode('utf-8'))
+    header = True
+    for chunk in iter_chunks(df):
+        f.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+        header = False
+
+
+def _write_json(df, f):
+    f.write(b'[')
+    first = True
+    for chunk in iter_chunks(df):
+        lines = chunk.to_json(orient='records', force_ascii=False, lines=True).strip()
+        if not lines:
+            continue
+        if not first:
+            f.write(b',')
+        f.write(b'\n' + lines.replace('\n', ',\n').encode('utf-8'))
+        first = False
+    f.write(b'\n]\n')
+
+
+def _arrow_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('id', pa.int64()),
+        ('type', pa.string()),
+        ('category', pa.string()),
+        ('amount', pa.float64()),
+        ('date', pa.date32()),
+        ('description', pa.string()),
+        ('timestamp', pa.string()),
+    ])
+
+
+def _arrow_batches(df, schema):
+    import pyarrow as pa
+    for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+        chunk = df.iloc[start:start + EXPORT_CHUNK_ROWS]
+        chunk = chunk.assign(
+            type=chunk['type'].astype(str),
+            category=chunk['category'].astype(str),
+            timestamp=format_timestamps(chunk['timestamp']).fillna('')
+        )
+        table = pa.Table.from_pandas(chunk[schema.names], preserve_index=False)
+        yield table.cast(schema)
+
+
+def _write_parquet(df, f):
+    import pyarrow.parquet as pq
+    schema = _arrow_schema()
+    with pq.ParquetWriter(f, schema, compression='zstd') as writer:
+        for table in _arrow_batches(df, schema):
+            writer.write_table(table)
+
+
+def _write_arrow(df, f):
+    import pyarrow as pa
+    schema = _arrow_schema()
+    options = pa.ipc.IpcWriteOptions(compression='zstd')
+    with pa.ipc.new_file(f, schema, options=options) as writer:
+        for table in _arrow_batches(df, schema):
+            writer.write_table(table)
+
+
+_WRITERS = {
+    'csv': _write_csv,
+    'json': _write_json,
+    'parquet': _write_parquet,
+    'arrow': _write_arrow,
+}
+
+
+def write_export(df, fmt, f):
+    """كتابة التصدير بالصيغة المطلوبة إلى ملف ثنائي مفتوح"""
+    _WRITERS[fmt](df, f)
+
+
+def export_buffer(df, fmt):
+    """إنشاء التصدير في مخزن BytesIO ومؤشره في البداية"""
+    f = io.BytesIO()
+    write_export(df, fmt, f)
+    f.seek(0)
+    return f
@@ -0,0 +1,220 @@
+"""استيراد المعاملات بالجملة من ملفات CSV/JSON وكشوف الحسابات البنكية
+
+الملف يُقرأ على دفعات، وكل دفعة يتم تنظيفها والتحقق منها بعمليات متجهة
+(vectorized) على الأعمدة، ثم تُستبعد المعاملات المكررة سواء داخل الملف أو
+الموجودة مسبقاً في السجل. الحفظ نفسه يتم مرة واحدة للدفعة كلها.
+"""
+import io
+from datetime import datetime
+
+import pandas as pd
+
+IMPORT_BATCH_ROWS = 50_000
+
+# أسماء الأعمدة المقبولة -> الاسم الداخلي
+COLUMN_ALIASES = {
+    'type': 'type', 'النوع': 'type', 'نوع المعاملة': 'type',
+    'category': 'category', 'الفئة': 'category',
+    'amount': 'amount', 'المبلغ': 'amount',
+    'date': 'date', 'التاريخ': 'date',
+    'description': 'description', 'الوصف': 'description', 'details': 'description', 'narrative': 'description',
+    'credit': 'credit', 'دائن': 'credit',
+    'debit': 'debit', 'مدين': 'debit',
+}
+
+TYPE_ALIASES = {
+    'revenue': 'revenue', 'income': 'revenue', 'إيراد': 'revenue', 'إيرادات': 'revenue',
+    'expense': 'expense', 'مصروف': 'expense', 'مصروفات': 'expense',
+}
+
+# الفئة الافتراضية لصفوف كشف الحساب التي لا تحتوي على فئة
+DEFAULT_IMPORT_CATEGORY = 'أخرى'
+
+MAX_CATEGORY_LENGTH = 50
+
+# ترتيب أجزاء التاريخ في الملف: السنة أولاً (ISO) دائماً مقبولة، والتواريخ الرقمية
+# الأخرى مثل 05/03/2024 تُقرأ فقط بالترتيب الذي يختاره المستخدم للملف كله،
+# وإلا تُرفض بدلاً من تخمين ترتيب كل صف على حدة
+DATE_ORDERS = {
+    'ymd': None,
+    'dmy': '%d/%m/%Y',
+    'mdy': '%m/%d/%Y',
+}
+
+DEDUP_COLUMNS = ['date', 'type', 'category', 'amount', 'description']
+
+
+def read_batches(source, file_name='', batch_rows=IMPORT_BATCH_ROWS):
+    """قراءة ملف CSV أو JSON أو JSON Lines على دفعات من DataFrames نصية"""
+    name = file_name.lower()
+    if name.endswith('.csv'):
+        yield from pd.read_csv(source, dtype=str, chunksize=batch_rows, encoding='utf-8-sig')
+        return
+
+    if name.endswith('.jsonl') or name.endswith('.ndjson'):
+        yield from pd.read_json(source, lines=True, dtype=False, chunksize=batch_rows)
+        return
+
+    # مصفوفة JSON لا يمكن قراءتها على أجزاء بدون مكتبة إضافية: تُقرأ مرة ثم تُقسَّم
+    data = source.read()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    df = pd.read_json(io.StringIO(data), orient='records', dtype=False)
+    for start in range(0, len(df), batch_rows):
+        yield df.iloc[start:start + batch_rows]
+
+
+def to_dates(values, date_order='ymd'):
+    """عمود التاريخ: ISO (السنة أولاً) ثم صيغة DATE_ORDERS[date_order] للباقي - NaT لغير ذلك"""
+    dates = pd.to_datetime(values, errors='coerce', format='ISO8601')
+    date_format = DATE_ORDERS[date_order]
+    text = (dates.isna() & values.notna()).to_numpy()
+    if date_format is not None and text.any():
+        # الوقت بعد التاريخ يُتجاهل، والفواصل - و . تعامل مثل /
+        day = values[text].astype(str).str.strip().str.split().str[0].str.replace(r'[-.]', '/', regex=True)
+        parsed = pd.to_datetime(day, errors='coerce', format=date_format).to_numpy(dtype='datetime64[ns]')
+        dates = dates.to_numpy(dtype='datetime64[ns]', copy=True)
+        dates[text] = parsed
+        dates = pd.Series(dates, index=values.index)
+    return dates.dt.normalize()
+
+
+def normalize_batch(raw, strict_type=False, date_order='ymd'):
+    """توحيد أسماء الأعمدة والقيم - يرجع DataFrame بالأعمدة الداخلية
+
+    strict_type: النوع مطلوب لكل صف وقيمته revenue أو expense فقط، بدون
+    استنتاجه من إشارة المبلغ (للأنظمة التي ترسل معاملات محددة النوع).
+    date_order: ترتيب التاريخ في الملف (DATE_ORDERS).
+    """
+    raw = raw.rename(columns=lambda c: COLUMN_ALIASES.get(str(c).strip().lower(), str(c).strip().lower()))
+    if raw.columns.duplicated().any():
+        # عمودان بنفس المعنى (مثل amount و المبلغ): أول قيمة غير فارغة
+        raw = pd.DataFrame({
+            name: raw.loc[:, raw.columns == name].bfill(axis=1).iloc[:, 0]
+            for name in raw.columns.unique()
+        })
+    n = len(raw)
+
+    def column(name, default=''):
+        if name in raw.columns:
+            return raw[name]
+        return pd.Series([default] * n, index=raw.index, dtype=object)
+
+    def to_amount(values):
+        # الأرقام (ومنها الصيغة العلمية 1e-05) كما هي، والنصوص التي لا تُقرأ كرقم فقط
+        # تُزال منها الفواصل والعملة: "1,250.00 ج.م" -> 1250.00
+        amount = pd.to_numeric(values, errors='coerce').astype('float64').to_numpy(copy=True)
+        text = (pd.isna(amount) & values.notna()).to_numpy()
+        if text.any():
+            number = values[text].astype(str).str.replace(',', '', regex=False).str.extract(r'(-?\d+(?:\.\d+)?)')[0]
+            amount[text] = pd.to_numeric(number, errors='coerce').to_numpy(dtype='float64')
+        return pd.Series(amount, index=values.index)
+
+    if 'amount' in raw.columns:
+        amount = to_amount(raw['amount'])
+    elif 'credit' in raw.columns or 'debit' in raw.columns:
+        # كشف حساب بنكي: دائن = إيراد، مدين = مصروف
+        amount = to_amount(column('credit', '0')).fillna(0) - to_amount(column('debit', '0')).fillna(0)
+    else:
+        amount = pd.Series(float('nan'), index=raw.index)
+
+    if strict_type:
+        trans_type = column('type', None).where(column('type', None).isin(['revenue', 'expense']))
+    elif 'type' in raw.columns:
+        trans_type = raw['type'].astype(str).str.strip().str.lower().map(TYPE_ALIASES)
+    else:
+        # بدون عمود نوع: الإشارة تحدد النوع
+        trans_type = pd.Series('revenue', index=raw.index).where(amount >= 0, 'expense')
+        amount = amount.abs()
+
+    category = column('category', DEFAULT_IMPORT_CATEGORY).fillna(DEFAULT_IMPORT_CATEGORY).astype(str).str.strip()
+    date = to_dates(column('date', None), date_order)
+    description = column('description').fillna('').astype(str).str.strip()
+
+    return pd.DataFrame({
+        'type': trans_type,
+        'category': category,
+        'amount': amount.round(2),
+        'date': date,
+        'description': description
+    })
+
+
+def validate_batch(df, allowed_categories=None):
+    """قناع الصفوف الصالحة وأسباب رفض الباقي - كل الفحوص على الأعمدة كاملة"""
+    reasons = pd.Series('', index=df.index, dtype=object)
+    reasons = reasons.mask(df['type'].isna(), 'نوع غير معروف')
+    reasons = reasons.mask((reasons == '') & ~(df['amount'] > 0), 'مبلغ غير صالح')
+    reasons = reasons.mask((reasons == '') & df['date'].isna(), 'تاريخ غير صالح')
+    bad_category = (df['category'] == '') | (df['category'].str.len() > MAX_CATEGORY_LENGTH)
+    if allowed_categories is not None:
+        bad_category |= ~df['category'].isin(list(allowed_categories))
+    reasons = reasons.mask((reasons == '') & bad_category, 'فئة غير صالحة')
+    return reasons == '', reasons
+
+
+def dedup_keys(df):
+    """بصمة لكل معاملة من (التاريخ، النوع، الفئة، المبلغ، الوصف)"""
+    keys = pd.DataFrame({
+        'date': df['date'].dt.strftime('%Y-%m-%d'),
+        'type': df['type'].astype(str),
+        'category': df['category'].astype(str),
+        'amount': df['amount'].astype(float).round(2),
+        'description': df['description'].fillna('').astype(str)
+    })
+    return pd.util.hash_pandas_object(keys[DEDUP_COLUMNS], index=False)
+
+
+def prepare_import(source, file_name, existing, allowed_categories=None, batch_rows=IMPORT_BATCH_ROWS,
+                   date_order='ymd'):
+    """قراءة الملف والتحقق منه واستبعاد المكرر
+
+    existing: DataFrame المعاملات الحالية (لاستبعاد ما هو موجود مسبقاً).
+    date_order: ترتيب التاريخ في الملف (DATE_ORDERS).
+    يرجع (الصفوف الجاهزة للحفظ، ملخص العملية، عينة من الصفوف المرفوضة).
+    """
+    seen = set(dedup_keys(existing).tolist()) if not existing.empty else set()
+    accepted = []
+    rejected = []
+    summary = {'read': 0, 'invalid': 0, 'duplicates': 0, 'imported': 0}
+
+    for raw in read_batches(source, file_name, batch_rows):
+        summary['read'] += len(raw)
+        batch = normalize_batch(raw, date_order=date_order)
+        valid, reasons = validate_batch(batch, allowed_categories)
+        summary['invalid'] += int((~valid).sum())
+        if len(rejected) < 20 and not valid.all():
+            rejected.append(raw[~valid].assign(السبب=reasons[~valid]).head(20))
+
+        batch = batch[valid]
+        keys = dedup_keys(batch)
+        fresh = ~keys.isin(seen) & ~keys.duplicated()
+        summary['duplicates'] += int((~fresh).sum())
+        seen.update(keys[fresh].tolist())
+        accepted.append(batch[fresh])
+
+    rows = pd.concat(accepted, ignore_index=True) if accepted else normalize_batch(pd.DataFrame())
+    summary['imported'] = len(rows)
+    sample = pd.concat(rejected).head(20) if rejected else None
+    return rows, summary, sample
+
+
+def validate_records(records, allowed_categories=None, strict_type=False):
+    """التحقق من معاملات جاءت كـ dicts (مثل واجهة الاستقبال) بنفس قواعد الاستيراد
+
+    يرجع (الصفوف الصالحة، [(رقم الصف، السبب)] للصفوف المرفوضة).
+    """
+    raw = pd.DataFrame.from_records(records) if records else pd.DataFrame()
+    batch = normalize_batch(raw, strict_type)
+    valid, reasons = validate_batch(batch, allowed_categories)
+    rejected = [(int(i), reason) for i, reason in reasons[~valid].items()]
+    return batch[valid], rejected
+
+
+def to_transactions(rows, timestamp=None):
+    """الصفوف الصالحة إلى معاملات بصيغة التخزين (بدون أرقام) جاهزة لعملية import"""
+    batch = rows.assign(
+        date=rows['date'].dt.strftime('%Y-%m-%d'),
+        timestamp=timestamp or datetime.now().isoformat()
+    )
+    return batch.to_dict('records')
@@ -0,0 +1,226 @@
+"""واجهة HTTP محلية لاستقبال المعاملات من أنظمة نقاط البيع و ERP
+
+    POST /transactions   معاملة واحدة (object) أو دفعة (array أو {"transactions": [...]})
+    GET  /health         حالة الخادم وعدد المعاملات والعمليات المعلقة
+
+الحقول نفس حقول نموذج الإضافة: type, category, amount, date, description
+(مع الأسماء البديلة المقبولة في الاستيراد بالجملة). type مطلوب وقيمته revenue
+أو expense: لا يُستنتج من إشارة المبلغ كما في كشوف الحسابات. الدفعة يُتحقق منها كاملة
+بنفس قواعد الاستيراد: أي صف غير صالح يرفض الدفعة كلها (422) مع سبب كل صف،
+وإلا تُحفظ بعملية import واحدة عبر خيط الكتابة، فالدفعات المتزامنة تُجمع في
+كتابة واحدة ولوحة التحكم تقرأ من نفس المحرك في الذاكرة.
+
+    PL_INGEST_PORT=8765 streamlit run app.py            # داخل عملية التطبيق
+    python ingest.py --port 8765                        # عملية مستقلة على نفس مجلد البيانات
+    python ingest.py --send pos.jsonl --batch-size 500  # عميل تجريبي يرسل ملفاً على دفعات
+
+- PL_INGEST_HOST: العنوان (افتراضي 127.0.0.1 - محلي فقط)
+- PL_INGEST_TOKEN: إذا حُدد يجب إرساله في الترويسة Authorization: Bearer <token>
+- PL_INGEST_MAX_BYTES: أقصى حجم للطلب (افتراضي 10 MB)
+"""
+import argparse
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import instrumentation
+import storage
+from engine import LedgerEngine, make_writer
+from importer import to_transactions, validate_records
+
+INGEST_HOST = os.environ.get('PL_INGEST_HOST', '127.0.0.1')
+INGEST_PORT = os.environ.get('PL_INGEST_PORT', '')
+INGEST_TOKEN = os.environ.get('PL_INGEST_TOKEN', '')
+INGEST_MAX_BYTES = int(os.environ.get('PL_INGEST_MAX_BYTES', str(10 * 2**20)))
+DEFAULT_PORT = 8765
+
+logger = logging.getLogger('pl.ingest')
+
+
+class IngestError(Exception):
+    """طلب مرفوض: رمز HTTP والرسالة (والتفاصيل إن وُجدت)"""
+
+    def __init__(self, status, message, details=None):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def parse_body(body):
+    """نص الطلب إلى قائمة معاملات (dicts)"""
+    try:
+        data = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise IngestError(400, f'JSON غير صالح: {exc}')
+    if isinstance(data, dict) and isinstance(data.get('transactions'), list):
+        data = data['transactions']
+    elif isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        raise IngestError(400, 'المتوقع معاملة (object) أو قائمة معاملات')
+    if not data:
+        raise IngestError(400, 'لا توجد معاملات')
+    return data
+
+
+def ingest(records, writer, allowed_categories=None):
+    """التحقق من دفعة وحفظها بعملية واحدة - يرجع عدد المعاملات المحفوظة"""
+    with instrumentation.span('ingest', rows=len(records)):
+        rows, rejected = validate_records(records, allowed_categories, strict_type=True)
+        if rejected:
+            raise IngestError(422, f'{len(rejected)} معاملة غير صالحة - لم يُحفظ شيء من الدفعة', [
+                {'index': index, 'reason': reason} for index, reason in rejected
+            ])
+        return writer.submit(('import', to_transactions(rows)))
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    """طلبات الاستقبال - المحرك وخيط الكتابة والرمز على كائن الخادم"""
+
+    server_version = 'pl-ingest/1'
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorize(self):
+        token = self.server.token
+        if token and not hmac.compare_digest(self.headers.get('Authorization', ''), f'Bearer {token}'):
+            raise IngestError(401, 'رمز الدخول غير صحيح')
+
+    def _read_body(self):
+        length = self.headers.get('Content-Length')
+        if length is None:
+            raise IngestError(411, 'الترويسة Content-Length مطلوبة')
+        if not length.isdigit():
+            raise IngestError(400, 'قيمة Content-Length غير صالحة')
+        length = int(length)
+        if length > INGEST_MAX_BYTES:
+            raise IngestError(413, f'الطلب أكبر من {INGEST_MAX_BYTES:,} بايت')
+        return self.rfile.read(length)
+
+    def _handle(self, action):
+        try:
+            self._authorize()
+            status, payload = action()
+        except IngestError as exc:
+            status, payload = exc.status, {'error': str(exc)}
+            if exc.details:
+                payload['rejected'] = exc.details
+        except Exception as exc:
+            logger.exception('فشل طلب الاستقبال')
+            status, payload = 500, {'error': f'{type(exc).__name__}: {exc}'}
+        self._send(status, payload)
+
+    def do_POST(self):
+        def action():
+            if self.path.rstrip('/') != '/transactions':
+                raise IngestError(404, 'المسار غير موجود')
+            records = parse_body(self._read_body())
+            return 201, {'imported': ingest(records, self.server.writer)}
+        self._handle(action)
+
+    def do_GET(self):
+        def action():
+            if self.path.rstrip('/') != '/health':
+                raise IngestError(404, 'المسار غير موجود')
+            engine, writer = self.server.engine, self.server.writer
+            pending = writer.pending() if isinstance(writer, storage.DebouncedWriter) else 0
+            return 200, {'status': 'ok', 'mode': engine.mode, 'count': engine.period_stats()[4], 'pending': pending}
+        self._handle(action)
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+def make_server(engine, writer, host=INGEST_HOST, port=DEFAULT_PORT, token=INGEST_TOKEN):
+    """خادم استقبال على المحرك وخيط الكتابة المعطيين (port=0 لمنفذ متاح)"""
+    server = ThreadingHTTPServer((host, port), IngestHandler)
+    server.daemon_threads = True
+    server.engine = engine
+    server.writer = writer
+    server.token = token
+    return server
+
+
+def start_server(engine, writer, host=INGEST_HOST, port=DEFAULT_PORT, token=INGEST_TOKEN):
+    """تشغيل خادم الاستقبال في خيط خلفي وإرجاعه (server.shutdown() لإيقافه)"""
+    server = make_server(engine, writer, host, port, token)
+    thread = threading.Thread(target=server.serve_forever, name='ingest-server', daemon=True)
+    thread.start()
+    logger.info('الاستقبال على http://%s:%s/transactions', *server.server_address[:2])
+    return server
+
+
+def post_transactions(url, transactions, token=INGEST_TOKEN, timeout=30):
+    """عميل بسيط: إرسال دفعة معاملات وإرجاع (رمز HTTP، الرد)"""
+    request = urllib.request.Request(
+        url, data=json.dumps(transactions, ensure_ascii=False).encode('utf-8'), method='POST',
+        headers={'Content-Type': 'application/json; charset=utf-8'}
+    )
+    if token:
+        request.add_header('Authorization', f'Bearer {token}')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as exc:
+        return exc.code, json.loads(exc.read() or b'{}')
+
+
+def send_file(path, url, batch_size=500, token=INGEST_TOKEN):
+    """إرسال ملف JSON أو JSON Lines على دفعات (بديل محلي لنظام نقاط البيع) - يرجع عدد الدفعات الفاشلة"""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.endswith(('.jsonl', '.ndjson')):
+            transactions = [json.loads(line) for line in f if line.strip()]
+        else:
+            transactions = json.load(f)
+    failed = 0
+    for start in range(0, len(transactions), batch_size):
+        status, reply = post_transactions(url, transactions[start:start + batch_size], token)
+        failed += status != 201
+        print(json.dumps({'from': start, 'status': status, **reply}, ensure_ascii=False))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='واجهة HTTP محلية لاستقبال المعاملات')
+    parser.add_argument('--dir', default='', help='مجلد السجل (افتراضياً المجلد الحالي)')
+    parser.add_argument('--host', default=INGEST_HOST)
+    parser.add_argument('--port', type=int, default=int(INGEST_PORT or DEFAULT_PORT))
+    parser.add_argument('--send', metavar='FILE', help='إرسال ملف JSON/JSON Lines إلى خادم يعمل بدلاً من التشغيل')
+    parser.add_argument('--batch-size', type=int, default=500, help='عدد المعاملات في كل طلب مع --send')
+    args = parser.parse_args(argv)
+
+    if args.send:
+        url = f'http://{args.host}:{args.port}/transactions'
+        return 1 if send_file(args.send, url, args.batch_size) else 0
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    engine = LedgerEngine(args.dir)
+    engine.refresh()
+    writer = make_writer(engine)
+    server = make_server(engine, writer, args.host, args.port)
+    logger.info('الاستقبال على http://%s:%s/transactions', *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if isinstance(writer, storage.DebouncedWriter):
+            writer.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""قياس زمن كل مرحلة في إعادة التشغيل (rerun) ومحلل أداء بأخذ العينات
+
+كل إعادة تشغيل للسكريبت لها سجل (trace) خاص بخيطها، وأي دالة تستطيع فتح
+مرحلة (span) بدون تمرير السجل إليها. كل مرحلة تسجل الزمن وعدد الصفوف
+والتغير في ذاكرة العملية (RSS). القياس معطل افتراضياً ولا يكلف شيئاً:
+
+- PL_PERF_LOG=1 يكتب سطر JSON لكل إعادة تشغيل إلى stderr (أو مسار ملف بدلاً من 1)
+- PL_DEBUG_PANEL=1 يعرض لوحة الأداء أسفل الصفحة لكل الزوار
+- PL_DEBUG_TOKEN: إذا حُدد تظهر اللوحة لمن يفتح الرابط بـ ?debug=<token> فقط
+- PL_PROFILE=1 يشغل محلل العينات ويحفظ ملف folded stacks لكل إعادة تشغيل في PL_PROFILE_DIR
+
+المراحل التي تعمل خارج إعادة التشغيل (خيط الكتابة، تنزيل التصدير) تُسجل
+كسطور مستقلة عند تفعيل PL_PERF_LOG.
+"""
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# psutil اختيارية: بدونها تُقرأ الذاكرة من /proc على Linux فقط
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+PERF_LOG = os.environ.get('PL_PERF_LOG', '')
+DEBUG_PANEL = os.environ.get('PL_DEBUG_PANEL', '') == '1'
+DEBUG_TOKEN = os.environ.get('PL_DEBUG_TOKEN', '')
+PROFILE = os.environ.get('PL_PROFILE', '') == '1'
+PROFILE_DIR = os.environ.get('PL_PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL = float(os.environ.get('PL_PROFILE_INTERVAL_MS', '5')) / 1000
+
+logger = logging.getLogger('pl.perf')
+
+_local = threading.local()
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _configure_logger():
+    if not PERF_LOG or logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr) if PERF_LOG == '1' else logging.FileHandler(PERF_LOG, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+_configure_logger()
+
+
+def current_rss():
+    """ذاكرة العملية الحالية بالبايت أو None إذا تعذرت قراءتها"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    return None
+
+
+class RerunTrace:
+    """مراحل إعادة تشغيل واحدة بترتيب بدايتها"""
+
+    def __init__(self, profiler=None):
+        self.started = time.perf_counter()
+        self.rss_start = current_rss()
+        self.spans = []
+        self.depth = 0
+        self.profiler = profiler
+
+    @contextmanager
+    def span(self, name, **info):
+        entry = {'name': name, 'depth': self.depth, **info}
+        self.spans.append(entry)
+        rss = current_rss()
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry['ms'] = round((time.perf_counter() - start) * 1000, 3)
+            self.depth -= 1
+            after = current_rss()
+            if rss is not None and after is not None:
+                entry['rss_delta_mb'] = round((after - rss) / 2**20, 3)
+
+    def summary(self):
+        """ملخص إعادة التشغيل كـ dict قابل للتحويل إلى JSON"""
+        rss = current_rss()
+        return {
+            'event': 'rerun',
+            'at': datetime.now().isoformat(timespec='milliseconds'),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'rss_mb': round(rss / 2**20, 1) if rss is not None else None,
+            'rss_delta_mb': round((rss - self.rss_start) / 2**20, 3) if rss is not None and self.rss_start is not None else None,
+            'spans': self.spans,
+        }
+
+
+class SamplingProfiler:
+    """أخذ عينات من مكدس خيط واحد كل interval ثانية في خيط خلفي
+
+    النتيجة بصيغة folded stacks (سطر لكل مكدس مع عدد مرات ظهوره)
+    المناسبة لأدوات flamegraph و speedscope.
+
+    owner: إطار السكريبت الذي بدأ القياس. الخيط يتوقف وحده عندما يخرج هذا
+    الإطار من المكدس مهما كانت طريقة انتهاء إعادة التشغيل (استثناء، أو
+    RerunException / StopException من Streamlit) حتى لو لم تُستدعَ stop.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL, owner=None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self._owner = owner
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rerun-profiler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            running = self._owner is None
+            while frame is not None:
+                running = running or frame is self._owner
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if not running:
+                # إعادة التشغيل انتهت بدون finish_rerun
+                break
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+        self._owner = None
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, directory=PROFILE_DIR):
+        """حفظ العينات في ملف جديد وإرجاع مساره"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, datetime.now().strftime('rerun-%Y%m%d-%H%M%S-%f.folded'))
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+        return path
+
+
+def debug_panel_enabled(token=None):
+    """هل تُعرض لوحة الأداء؟ PL_DEBUG_PANEL=1، أو رمز ?debug= يطابق PL_DEBUG_TOKEN
+
+    بدون PL_DEBUG_TOKEN لا يفتح الرابط وحده اللوحة لأي زائر.
+    """
+    if DEBUG_PANEL:
+        return True
+    return bool(DEBUG_TOKEN and token) and hmac.compare_digest(token, DEBUG_TOKEN)
+
+
+def start_rerun(enabled=False, profile=PROFILE):
+    """بدء سجل جديد لإعادة التشغيل الحالية (None إذا كان القياس معطلاً)"""
+    previous = getattr(_local, 'trace', None)
+    if previous is not None and previous.profiler is not None:
+        # إعادة تشغيل سابقة انتهت مبكراً (st.rerun) قبل finish_rerun
+        previous.profiler.stop()
+
+    if not (enabled or PERF_LOG or profile):
+        _local.trace = None
+        return None
+    # إطار السكريبت المستدعي: المحلل يتوقف عند خروجه حتى لو لم تصل إعادة التشغيل إلى finish_rerun
+    profiler = SamplingProfiler(threading.get_ident(), owner=sys._getframe(1)) if profile else None
+    _local.trace = RerunTrace(profiler)
+    return _local.trace
+
+
+def finish_rerun():
+    """إنهاء سجل إعادة التشغيل الحالية وكتابته - يرجع الملخص أو None"""
+    trace = getattr(_local, 'trace', None)
+    _local.trace = None
+    if trace is None:
+        return None
+    summary = trace.summary()
+    if trace.profiler is not None:
+        trace.profiler.stop()
+        summary['profile'] = trace.profiler.dump()
+    if PERF_LOG:
+        logger.info(json.dumps(summary, ensure_ascii=False))
+    return summary
+
+
+@contextmanager
+def span(name, **info):
+    """مرحلة داخل إعادة التشغيل الحالية، أو سطر مستقل خارجها عند تفعيل السجل"""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        with trace.span(name, **info) as entry:
+            yield entry
+        return
+    if not PERF_LOG:
+        yield info
+        return
+
+    standalone = RerunTrace()
+    with standalone.span(name, **info) as entry:
+        yield entry
+    logger.info(json.dumps({'event': 'span', 'at': datetime.now().isoformat(timespec='milliseconds'),
+                            'thread': threading.current_thread().name, **entry}, ensure_ascii=False))
@@ -0,0 +1,677 @@
+"""سجل المعاملات العمودي في الذاكرة
+
+يحتفظ بالمعاملات في DataFrame واحد بأنواع ثابتة (تاريخ ووقت إنشاء datetime64،
+نوع وفئة categorical، مبلغ رقمي) مرتب حسب التاريخ، ويتم تحديثه مباشرة عند
+الإضافة والحذف بدلاً من إعادة بنائه وتحليل التواريخ مع كل إعادة تشغيل.
+
+المجاميع تُحسب بالقروش (أعداد صحيحة) وليس بالجنيه (float) حتى تبقى دقيقة
+مهما كثرت الإضافات والحذوفات.
+"""
+import bisect
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['id', 'type', 'category', 'amount', 'date', 'description', 'timestamp']
+TYPE_DTYPE = pd.CategoricalDtype(['revenue', 'expense'])
+
+# عدد القروش في الجنيه: المبالغ تُجمع كأعداد صحيحة بهذه الوحدة
+MINOR_UNITS = 100
+
+
+def to_minor(amount):
+    """مبلغ بالجنيه (رقم أو Series) إلى عدد صحيح بالقروش"""
+    if isinstance(amount, pd.Series):
+        return (amount * MINOR_UNITS).round().astype('int64')
+    return int(round(float(amount) * MINOR_UNITS))
+
+
+def from_minor(minor):
+    """عدد القروش إلى مبلغ بالجنيه"""
+    return minor / MINOR_UNITS
+
+
+def format_timestamps(timestamps):
+    """وقت الإنشاء (datetime64) إلى نص ISO كما كتبه datetime.isoformat() - None إذا كان فارغاً"""
+    values = timestamps.to_numpy(dtype='datetime64[us]')
+    seconds = values.astype('datetime64[s]')
+    # الأجزاء من الثانية تُكتب فقط إذا لم تكن صفراً، مثل isoformat()
+    text = np.where(values == seconds, np.datetime_as_string(seconds, unit='s'), np.datetime_as_string(values, unit='us'))
+    return pd.Series(text, index=timestamps.index, dtype=object).where(timestamps.notna(), None)
+
+
+def to_records(df):
+    """تحويل DataFrame بأعمدة to_frame إلى قائمة dicts بصيغة ملف JSON"""
+    columns = [
+        df['id'].tolist(),
+        df['type'].tolist(),
+        df['category'].tolist(),
+        df['amount'].tolist(),
+        np.datetime_as_string(df['date'].to_numpy(dtype='datetime64[D]')).tolist(),
+        df['description'].tolist(),
+        format_timestamps(df['timestamp']).tolist(),
+    ]
+    # بناء الـ dicts من أعمدة Python مباشرة أسرع كثيراً من DataFrame.to_dict
+    return [dict(zip(COLUMNS, row)) for row in zip(*columns)]
+
+
+def to_frame(transactions, sort=True):
+    """تحويل قائمة معاملات (dicts) إلى DataFrame عمودي مرتب حسب التاريخ
+
+    sort=False يحتفظ بترتيب القائمة كما هو (مثل صفحة مرتبة مسبقاً داخل SQL).
+    """
+    df = pd.DataFrame(list(transactions), columns=COLUMNS)
+    df['id'] = df['id'].astype('int64')
+    df['type'] = df['type'].astype(TYPE_DTYPE)
+    df['category'] = df['category'].astype('category')
+    df['amount'] = df['amount'].astype('float64')
+    df['date'] = pd.to_datetime(df['date'], format='ISO8601').dt.normalize()
+    df['description'] = df['description'].fillna('')
+    # 8 بايت لكل صف بدلاً من نص ISO كامل
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601', errors='coerce')
+    if sort:
+        # mergesort مستقر: المعاملات في نفس اليوم تبقى بترتيب إضافتها
+        df = df.sort_values('date', kind='mergesort', ignore_index=True)
+    return df
+
+
+# نوافذ الرسم البياني: عدد الأيام -> حجم الفترة (يوم/أسبوع/شهر)، 0 تعني كل الفترة يومياً
+CHART_WINDOWS = {7: 'D', 30: 'D', 90: 'W', 365: 'M', 0: 'D'}
+
+
+def bucket_totals(frame, days=7, freq='D', end=None):
+    """مجاميع الإيرادات والمصروفات لكل فترة زمنية خلال آخر days يوم
+
+    يتم التجميع في تمريرة groupby واحدة بدلاً من قناع منفصل لكل يوم ونوع.
+    freq: 'D' يوم، 'W' أسبوع، 'M' شهر. النتيجة مفهرسة بالفترات بما فيها الفارغة.
+    days=0 يبدأ من أقدم معاملة في frame.
+    """
+    end = pd.Timestamp.now().normalize() if end is None else pd.Timestamp(end).normalize()
+    if days:
+        start = end - pd.Timedelta(days=days - 1)
+    else:
+        start = min(frame['date'].iloc[0], end) if len(frame) else end
+
+    dates = frame['date']
+    lo = dates.searchsorted(start, side='left')
+    hi = dates.searchsorted(end, side='right')
+    window = frame.iloc[lo:hi]
+
+    buckets = pd.period_range(start, end, freq=freq)
+    grouped = to_minor(window['amount']).groupby(
+        [window['date'].dt.to_period(freq), window['type']], observed=False
+    ).sum().unstack('type', fill_value=0)
+    return from_minor(grouped.reindex(index=buckets, columns=['revenue', 'expense'], fill_value=0))
+
+
+def lttb_indices(values, threshold):
+    """مواضع النقاط التي يحتفظ بها Largest-Triangle-Three-Buckets
+
+    السلسلة تُقسم إلى threshold - 2 مجموعة بين النقطتين الأولى والأخيرة، ومن
+    كل مجموعة تؤخذ النقطة التي تصنع أكبر مثلث مع النقطة المختارة قبلها ومتوسط
+    المجموعة التالية، فتبقى القمم والقيعان ويختفي التكرار في المناطق المسطحة.
+    المحور الأفقي هو موضع النقطة (فترات متساوية).
+    """
+    y = np.asarray(values, dtype='float64')
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype('int64')
+    selected = np.empty(threshold, dtype='int64')
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = (edges[i + 1] + edges[i + 2] - 1) / 2
+            next_y = y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            next_x, next_y = n - 1, y[n - 1]
+        xs = np.arange(lo, hi)
+        # ضعف مساحة المثلث (a، النقطة المرشحة، متوسط المجموعة التالية)
+        areas = np.abs((a - next_x) * (y[lo:hi] - y[a]) - (a - xs) * (next_y - y[a]))
+        a = lo + int(areas.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def comparison_periods(freq='M', periods=12, today=None):
+    """آخر periods شهراً ('M') أو ربعاً ('Q') حتى الفترة الحالية - يرجع (التسميات، الحدود)
+
+    الحدود بصيغة RunningTotals.period_matrix: بداية كل فترة ثم اليوم التالي لنهاية الأخيرة.
+    """
+    today = pd.Timestamp(today or datetime.now().date())
+    index = pd.period_range(end=today.to_period(freq), periods=periods, freq=freq)
+    starts = index.start_time.strftime('%Y-%m-%d').tolist()
+    after_last = (index[-1].end_time.normalize() + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    return [str(period) for period in index], starts + [after_last]
+
+
+def comparison_tables(matrix, labels):
+    """جدول الملخص (صف لكل فترة) وجدول الفئات (صف لكل فئة/نوع، عمود لكل فترة)"""
+    summary = pd.DataFrame({
+        'revenue': matrix['revenue'],
+        'expense': matrix['expense'],
+        'count': matrix['count'],
+    }, index=labels)
+    summary['net_profit'] = (summary['revenue'] - summary['expense']).round(2)
+    # لا توجد نسبة تغير بعد فترة صافيها صفر
+    previous = summary['net_profit'].shift(1).replace(0.0, float('nan'))
+    summary['change_pct'] = ((summary['net_profit'] - previous) / previous.abs() * 100).round(2)
+
+    rows = {key: values for key, values in matrix['categories'].items() if any(values)}
+    index = pd.MultiIndex.from_tuples(sorted(rows), names=['category', 'type'])
+    categories = pd.DataFrame([rows[key] for key in index], index=index, columns=labels)
+    return summary, categories
+
+
+def period_bounds(period='all', today=None):
+    """حدود الفترة (من، إلى) كنصوص تاريخ، None تعني بدون حد"""
+    today = today or datetime.now().date()
+
+    if period == 'today':
+        return today.isoformat(), None
+    if period == 'week':
+        return (today - timedelta(days=7)).isoformat(), None
+    if period == 'month':
+        month_start = today.replace(day=1)
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        return month_start.isoformat(), (next_month - timedelta(days=1)).isoformat()
+    return None, None
+
+
+def summarize(total_revenue, total_expense):
+    """صافي الربح ونسبة الربح من مجموع الإيرادات والمصروفات"""
+    # المجموعان دقيقان بالقروش: التقريب يزيل خطأ طرح الأعداد العشرية فقط
+    net_profit = round(total_revenue - total_expense, 2)
+    profit_margin = (net_profit / total_revenue * 100) if total_revenue > 0 else 0
+    return total_revenue, total_expense, net_profit, profit_margin
+
+
+def calculate_stats(transactions):
+    """حساب الإحصائيات"""
+    if transactions.empty:
+        return 0, 0, 0, 0
+
+    totals = to_minor(transactions['amount']).groupby(transactions['type'], observed=False).sum()
+    return summarize(from_minor(totals.get('revenue', 0)), from_minor(totals.get('expense', 0)))
+
+
+def bucket_labels(buckets, freq):
+    """تسميات محور الرسم البياني لفترات bucket_totals"""
+    return buckets.index.start_time.strftime('%Y-%m' if freq == 'M' else '%Y-%m-%d').tolist()
+
+
+def display_table(page):
+    """جدول العرض لصفحة المعاملات - التنسيق لصفوف الصفحة فقط"""
+    return pd.DataFrame({
+        'الرقم': page['id'],
+        'التاريخ': page['date'].dt.strftime('%Y-%m-%d'),
+        'النوع': page['type'].map({'revenue': 'إيراد', 'expense': 'مصروف'}),
+        'الفئة': page['category'],
+        'المبلغ': [f"{x:,.2f} ج.م" for x in page['amount']],
+        'الوصف': page['description']
+    })
+
+
+def sort_page(frame, sort_by='date', descending=True, offset=0, limit=50):
+    """صفحة واحدة من الجدول بعد الترتيب
+
+    الجدول مرتب حسب التاريخ مسبقاً فالترتيب بالتاريخ مجرد قطع للمدى المطلوب،
+    وباقي الأعمدة تُرتب مواضعها فقط ثم تؤخذ صفوف الصفحة.
+    """
+    n = len(frame)
+    # صفحة بعد آخر صف فارغة (بدون هذا يصبح حد القطع سالباً في الترتيب التنازلي)
+    offset = min(offset, n)
+    stop = min(offset + limit, n)
+    if sort_by == 'date':
+        if descending:
+            return frame.iloc[n - stop:n - offset].iloc[::-1]
+        return frame.iloc[offset:stop]
+
+    values = frame[sort_by].reset_index(drop=True)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # ترتيب أبجدي وليس بترتيب إنشاء الفئات
+        values = values.astype(str)
+    # التاريخ مفتاح ثانوي: الصفوف المتساوية تبقى بترتيبها الزمني
+    order = values.sort_values(ascending=not descending, kind='mergesort').index
+    return frame.iloc[order[offset:stop]]
+
+
+def concat_frames(frames):
+    """دمج أطر معاملات مرتبة متتالية (من عدة شرائح) مع توحيد فئات عمود الفئة"""
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return to_frame([])
+    if len(frames) == 1:
+        return frames[0]
+    categories = frames[0]['category'].cat.categories
+    for frame in frames[1:]:
+        categories = categories.union(frame['category'].cat.categories)
+    dtype = pd.CategoricalDtype(categories)
+    return pd.concat([frame.astype({'category': dtype}) for frame in frames], ignore_index=True)
+
+
+class Ledger:
+    """مخزن عمودي مرتب حسب التاريخ مع فلترة الفترات بالبحث الثنائي
+
+    الجزء الرئيسي (frame) مرتب ولا يُعاد ترتيبه مع كل إضافة: المعاملات الجديدة
+    تُلحق بذيل صغير، والحذف يضع علامة (tombstone) على الرقم فقط. الدمج
+    (compact) يدمج الذيل ويزيل المحذوفات ويعيد بناء فهرس الأرقام عند تجاوز الحد.
+
+    لكل فئة قائمة بمواضع صفوفها في الجزء الرئيسي مرتبة بالتاريخ، ففلتر الفئة
+    يمر على صفوفها فقط بدلاً من مقارنة عمود الفئة كاملاً.
+    """
+
+    TAIL_LIMIT = 1024
+
+    def __init__(self, transactions=(), next_id=1):
+        frame = to_frame(transactions)
+        self.next_id = max(next_id, int(frame['id'].max()) + 1 if len(frame) else 1)
+
+        # الإصدارات القديمة كانت تعيد استخدام الأرقام بعد الحذف: نعطي المكرر رقماً جديداً
+        duplicated = frame['id'].duplicated()
+        if duplicated.any():
+            fresh = range(self.next_id, self.next_id + int(duplicated.sum()))
+            frame.loc[duplicated, 'id'] = list(fresh)
+            self.next_id += len(fresh)
+
+        self._set_main(frame)
+
+    @classmethod
+    def from_frame(cls, frame, next_id=1, id_order=None, category_order=None):
+        """سجل من DataFrame جاهز بأعمدة to_frame ومرتب حسب التاريخ وبدون أرقام مكررة (لقطة عمودية)
+
+        id_order و category_order: فهرسا الأرقام والفئات المحفوظان مع الإطار (إن وُجدا) بدلاً من حسابهما.
+        """
+        ledger = cls.__new__(cls)
+        ledger.next_id = max(next_id, int(frame['id'].max()) + 1 if len(frame) else 1)
+        ledger._set_main(frame, id_order, category_order)
+        return ledger
+
+    def _set_main(self, frame, id_order=None, category_order=None):
+        self.frame = frame
+        # فهرس الأرقام كمصفوفتين (الأرقام مرتبة وموضع كل منها) بدلاً من dict
+        # بمئة بايت تقريباً لكل معاملة
+        ids = frame['id'].to_numpy()
+        self._id_order = np.argsort(ids, kind='stable') if id_order is None else id_order
+        # قوائم الفئات: المواضع مجمعة حسب رمز الفئة، وداخل كل فئة بترتيب الإطار (التاريخ).
+        # الرمز -1 (بدون فئة) أولاً، فقائمة الفئة c هي category_order[offsets[c + 1]:offsets[c + 2]]
+        codes = frame['category'].cat.codes.to_numpy()
+        self._category_order = np.argsort(codes, kind='stable') if category_order is None else category_order
+        self._category_offsets = np.concatenate([[0], np.cumsum(np.bincount(codes + 1, minlength=1))])
+        self._sorted_ids = ids[self._id_order]
+        self.deleted = frozenset()
+        self.tail = {}
+        self._tail_frame = None
+
+    def __len__(self):
+        return len(self.frame) - len(self.deleted) + len(self.tail)
+
+    def allocate_id(self):
+        """رقم جديد متزايد لا يُعاد استخدامه بعد الحذف"""
+        trans_id = self.next_id
+        self.next_id += 1
+        return trans_id
+
+    def add(self, transaction):
+        """إضافة معاملة إلى الذيل - تكلفة ثابتة"""
+        category = transaction['category']
+        if category not in self.frame['category'].cat.categories:
+            # نسخة جديدة بدلاً من تعديل الإطار الحالي الذي قد تقرؤه جلسة أخرى
+            self.frame = self.frame.assign(category=self.frame['category'].cat.add_categories([category]))
+
+        tail = dict(self.tail)
+        tail[transaction['id']] = transaction
+        self.tail = tail
+        self._tail_frame = None
+        self.next_id = max(self.next_id, transaction['id'] + 1)
+        if len(self.tail) >= self.TAIL_LIMIT:
+            self.compact()
+
+    def extend(self, transactions):
+        """إضافة دفعة كبيرة: دمج واحد مع الجزء الرئيسي بدلاً من المرور بالذيل"""
+        batch = to_frame(transactions)
+        if batch.empty:
+            return
+        self.next_id = max(self.next_id, int(batch['id'].max()) + 1)
+        live = self.between()
+        categories = live['category'].cat.categories.union(batch['category'].cat.categories)
+        merged = pd.concat([
+            live.astype({'category': pd.CategoricalDtype(categories)}),
+            batch.astype({'category': pd.CategoricalDtype(categories)})
+        ], ignore_index=True)
+        self._set_main(merged.sort_values('date', kind='mergesort', ignore_index=True))
+
+    def get(self, trans_id):
+        """البحث عن معاملة بالرقم عبر الفهرس - تكلفة ثابتة"""
+        if trans_id in self.tail:
+            return dict(self.tail[trans_id])
+        pos = self._position(trans_id)
+        if pos is None or trans_id in self.deleted:
+            return None
+        row = self.frame.iloc[pos]
+        return {
+            'id': int(row['id']),
+            'type': row['type'],
+            'category': row['category'],
+            'amount': float(row['amount']),
+            'date': row['date'].strftime('%Y-%m-%d'),
+            'description': row['description'],
+            'timestamp': None if pd.isna(row['timestamp']) else row['timestamp'].isoformat()
+        }
+
+    def _position(self, trans_id):
+        """موضع الرقم في الجزء الرئيسي بالبحث الثنائي أو None"""
+        i = int(self._sorted_ids.searchsorted(trans_id))
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == trans_id:
+            return int(self._id_order[i])
+        return None
+
+    def delete(self, trans_id):
+        """حذف معاملة بالرقم (علامة حذف حتى الدمج التالي) وإرجاعها"""
+        removed = self.get(trans_id)
+        if removed is None:
+            return None
+        if trans_id in self.tail:
+            tail = dict(self.tail)
+            del tail[trans_id]
+            self.tail = tail
+            self._tail_frame = None
+        else:
+            self.deleted = self.deleted | {trans_id}
+            if len(self.deleted) > max(self.TAIL_LIMIT, len(self.frame) // 10):
+                self.compact()
+        return removed
+
+    def compact(self):
+        """دمج الذيل في الجزء الرئيسي المرتب وإزالة المحذوفات"""
+        self._set_main(self.between().reset_index(drop=True))
+
+    def _tail_rows(self):
+        if not self.tail:
+            return None
+        if self._tail_frame is None:
+            tail_frame = to_frame(self.tail.values())
+            tail_frame['category'] = tail_frame['category'].astype(self.frame['category'].dtype)
+            # أرقام صفوف لا تتعارض مع صفوف الجزء الرئيسي
+            tail_frame.index = pd.RangeIndex(len(self.frame), len(self.frame) + len(tail_frame))
+            self._tail_frame = tail_frame
+        return self._tail_frame
+
+    def _category_rows(self, frame, category):
+        """مواضع صفوف الفئة في الجزء الرئيسي مرتبة بالتاريخ"""
+        code = frame['category'].cat.categories.get_indexer([category])[0]
+        offsets = self._category_offsets
+        if code < 0 or code + 2 >= len(offsets):
+            # فئة غير موجودة أو أُضيفت بعد بناء القوائم (صفوفها في الذيل فقط)
+            return self._category_order[:0]
+        return self._category_order[offsets[code + 1]:offsets[code + 2]]
+
+    def between(self, date_from=None, date_to=None, category=None):
+        """المعاملات بين تاريخين (شاملة) عن طريق البحث الثنائي على التواريخ المرتبة
+
+        category: صفوف فئة واحدة من قائمتها فقط (الفترة بحث ثنائي على مواضعها).
+        """
+        frame, deleted, tail = self.frame, self.deleted, self._tail_rows()
+
+        dates = frame['date']
+        start = 0 if date_from is None else dates.searchsorted(pd.Timestamp(date_from), side='left')
+        end = len(dates) if date_to is None else dates.searchsorted(pd.Timestamp(date_to), side='right')
+        if category is None:
+            result = frame.iloc[start:end]
+        else:
+            rows = self._category_rows(frame, category)
+            result = frame.iloc[rows[rows.searchsorted(start):rows.searchsorted(end)]]
+        if deleted:
+            result = result[~result['id'].isin(list(deleted))]
+
+        if tail is not None:
+            mask = pd.Series(True, index=tail.index)
+            if date_from is not None:
+                mask &= tail['date'] >= pd.Timestamp(date_from)
+            if date_to is not None:
+                mask &= tail['date'] <= pd.Timestamp(date_to)
+            if category is not None:
+                mask &= tail['category'] == category
+            if mask.any():
+                result = pd.concat([result, tail[mask]]).sort_values('date', kind='mergesort')
+        return result
+
+    def query(self, date_from=None, date_to=None, trans_type=None, category=None):
+        """المعاملات المطابقة للفلاتر"""
+        df = self.between(date_from, date_to, category)
+        if trans_type is not None:
+            df = df[df['type'] == trans_type]
+        return df
+
+    def to_records(self):
+        """تحويل السجل إلى قائمة dicts بصيغة ملف JSON"""
+        return to_records(self.between())
+
+
+class RunningTotals:
+    """مجاميع تراكمية لكل يوم/نوع/فئة تُحدَّث مع كل إضافة وحذف
+
+    المفاتيح تواريخ نصية بصيغة YYYY-MM-DD وكل قيمة [المجموع بالقروش، العدد].
+    فوقها مجاميع بادئة (prefix sums) على الأيام المرتبة لكل نوع ولكل فئة،
+    فمجموع أي فترة هو الفرق بين قيمتين. الإضافة لآخر يوم أو ليوم جديد بعده
+    تُحدِّث المجاميع البادئة مباشرة، وأي تعديل ليوم أقدم يعيد بناءها عند
+    الاستعلام التالي.
+    """
+
+    def __init__(self):
+        self.by_day = {}
+        self.by_type = {}
+        self.by_category = {}
+        self.by_day_category = {}
+        self.day_counts = {}
+        self.days = []
+        self._prefix = None
+        self._version = 0
+
+    @classmethod
+    def from_groups(cls, groups):
+        """البناء من مجموعات (يوم، نوع، فئة، مجموع، عدد)"""
+        totals = cls()
+        for day, trans_type, category, amount, count in groups:
+            totals.add(day, trans_type, category, amount, count)
+        return totals
+
+    @classmethod
+    def from_frame(cls, frame):
+        """البناء من DataFrame المعاملات في تمريرة تجميع واحدة"""
+        totals = cls()
+        totals.add_frame(frame)
+        return totals
+
+    def groups(self):
+        """المجموعات (يوم، نوع، فئة، مجموع، عدد) التي تعيد بناء المجاميع بـ from_groups"""
+        return [
+            (day, trans_type, category, from_minor(amount), count)
+            for (day, category, trans_type), (amount, count) in sorted(self.by_day_category.items())
+        ]
+
+    def add_frame(self, frame):
+        """إضافة دفعة معاملات (DataFrame) بعد تجميعها"""
+        if frame.empty:
+            return
+        grouped = to_minor(frame['amount']).groupby(
+            [frame['date'], frame['type'], frame['category']], observed=True
+        ).agg(['sum', 'count'])
+        # تنسيق التواريخ للمجموعات فقط وليس لكل صف
+        days = grouped.index.get_level_values(0).strftime('%Y-%m-%d')
+        for day, (_, trans_type, category), (minor, count) in zip(days, grouped.index, grouped.to_numpy()):
+            self._add_minor(day, trans_type, category, int(minor), int(count))
+
+    @staticmethod
+    def _bump(table, key, amount, count):
+        entry = table.get(key)
+        if entry is None:
+            table[key] = [amount, count]
+            return
+        entry[0] += amount
+        entry[1] += count
+        if entry[1] <= 0:
+            del table[key]
+
+    def add(self, day, trans_type, category, amount, count=1):
+        """إضافة مبلغ (بالجنيه) إلى كل المجاميع"""
+        self._add_minor(day, trans_type, category, to_minor(amount), int(count))
+
+    def _add_minor(self, day, trans_type, category, amount, count):
+        self._bump(self.by_day, (day, trans_type), amount, count)
+        self._bump(self.by_type, trans_type, amount, count)
+        self._bump(self.by_category, (category, trans_type), amount, count)
+        self._bump(self.by_day_category, (day, category, trans_type), amount, count)
+        self._update_prefix(day, trans_type, category, amount, count)
+
+        day_count = self.day_counts.get(day, 0)
+        if day_count == 0:
+            bisect.insort(self.days, day)
+        day_count += count
+        if day_count <= 0:
+            del self.day_counts[day]
+            self.days.pop(bisect.bisect_left(self.days, day))
+        else:
+            self.day_counts[day] = day_count
+
+    def remove(self, day, trans_type, category, amount, count=1):
+        """طرح مبلغ معاملة محذوفة"""
+        self._add_minor(day, trans_type, category, -to_minor(amount), -int(count))
+
+    def _build_prefix(self):
+        """بناء المجاميع البادئة من المجاميع اليومية - تمريرة واحدة على الأيام"""
+        version = self._version
+        per_day = {}
+        for (day, category, trans_type), (amount, count) in list(self.by_day_category.items()):
+            per_day.setdefault(day, []).append((category, trans_type, amount, count))
+
+        days = sorted(per_day)
+        prefix = {'days': days, 'revenue': [0], 'expense': [0], 'count': [0], 'categories': {}}
+        categories = prefix['categories']
+        for i, day in enumerate(days):
+            revenue = expense = 0
+            count = 0
+            for category, trans_type, amount, n in per_day[day]:
+                if trans_type == 'revenue':
+                    revenue += amount
+                else:
+                    expense += amount
+                count += n
+                column = categories.get((category, trans_type))
+                if column is None:
+                    column = categories[(category, trans_type)] = [0] * (i + 1)
+                column.extend([column[-1]] * (i + 1 - len(column)))
+                column.append(column[-1] + amount)
+            prefix['revenue'].append(prefix['revenue'][-1] + revenue)
+            prefix['expense'].append(prefix['expense'][-1] + expense)
+            prefix['count'].append(prefix['count'][-1] + count)
+        for column in categories.values():
+            column.extend([column[-1]] * (len(days) + 1 - len(column)))
+
+        # تعديل حدث أثناء البناء: النتيجة تُستخدم لهذا الاستعلام فقط
+        if version == self._version:
+            self._prefix = prefix
+        return prefix
+
+    def _update_prefix(self, day, trans_type, category, amount, count):
+        """تحديث المجاميع البادئة لآخر يوم أو ليوم جديد، وإلا إلغاؤها"""
+        prefix = self._prefix
+        if prefix is None:
+            self._version += 1
+            return
+        days = prefix['days']
+        columns = [prefix[trans_type], prefix['count']]
+        column = prefix['categories'].get((category, trans_type))
+        if column is None:
+            column = [0] * (len(days) + 1)
+        columns.append(column)
+
+        if days and day == days[-1]:
+            for values, delta in zip(columns, (amount, count, amount)):
+                values[-1] += delta
+        elif (not days or day > days[-1]) and count > 0:
+            # الأعمدة أولاً ثم قائمة الأيام حتى لا يرى القارئ يوماً بدون قيم
+            for values in (prefix['revenue'], prefix['expense'], prefix['count'], *prefix['categories'].values()):
+                if values is not column:
+                    values.append(values[-1])
+            column.append(column[-1])
+            for values, delta in zip(columns, (amount, count, amount)):
+                values[-1] += delta
+            days.append(day)
+        else:
+            self._prefix = None
+            self._version += 1
+            return
+        prefix['categories'][(category, trans_type)] = column
+
+    def _prefix_range(self, date_from, date_to):
+        """المجاميع البادئة وموضعا بداية ونهاية الفترة"""
+        prefix = self._prefix or self._build_prefix()
+        days = prefix['days']
+        start = 0 if date_from is None else bisect.bisect_left(days, date_from)
+        end = len(days) if date_to is None else bisect.bisect_right(days, date_to)
+        return prefix, start, max(start, end)
+
+    def totals(self, date_from=None, date_to=None):
+        """(الإيرادات، المصروفات، العدد) لفترة - الحدود شاملة
+
+        الفترة الكاملة تُقرأ مباشرة، وغيرها فرق قيمتين من المجاميع البادئة.
+        """
+        if date_from is None and date_to is None:
+            revenue, revenue_count = self.by_type.get('revenue', (0, 0))
+            expense, expense_count = self.by_type.get('expense', (0, 0))
+            return from_minor(revenue), from_minor(expense), revenue_count + expense_count
+
+        prefix, start, end = self._prefix_range(date_from, date_to)
+        revenue = prefix['revenue'][end] - prefix['revenue'][start]
+        expense = prefix['expense'][end] - prefix['expense'][start]
+        count = prefix['count'][end] - prefix['count'][start]
+        return from_minor(revenue), from_minor(expense), count
+
+    def category_totals(self, date_from=None, date_to=None):
+        """{(الفئة، النوع): المجموع} لفترة - الحدود شاملة"""
+        if date_from is None and date_to is None:
+            return {key: from_minor(entry[0]) for key, entry in self.by_category.items()}
+
+        prefix, start, end = self._prefix_range(date_from, date_to)
+        totals = {}
+        for key, column in list(prefix['categories'].items()):
+            amount = column[end] - column[start]
+            if amount:
+                totals[key] = from_minor(amount)
+        return totals
+
+    def count(self, trans_type=None, category=None):
+        """عدد المعاملات من نوع و/أو فئة بدون المرور على المعاملات"""
+        if category is not None:
+            types = [trans_type] if trans_type is not None else ['revenue', 'expense']
+            return sum(self.by_category.get((category, t), (0, 0))[1] for t in types)
+        if trans_type is not None:
+            return self.by_type.get(trans_type, (0, 0))[1]
+        return sum(entry[1] for entry in self.by_type.values())
+
+    def period_matrix(self, boundaries):
+        """مجاميع فترات متتالية دفعة واحدة
+
+        boundaries تواريخ نصية مرتبة: بداية كل فترة ثم اليوم التالي لنهاية
+        الأخيرة. كل فترة فرق قيمتين من المجاميع البادئة، فالمصفوفة كلها
+        (الفترات × الفئات) تكلف بحثاً ثنائياً لكل حد وطرحاً لكل خلية.
+        يرجع {'revenue'|'expense'|'count': [قيمة لكل فترة], 'categories': {(الفئة، النوع): [...]}}.
+        """
+        prefix = self._prefix or self._build_prefix()
+        positions = [bisect.bisect_left(prefix['days'], day) for day in boundaries]
+        pairs = list(zip(positions, positions[1:]))
+
+        def diffs(column):
+            return [from_minor(column[end] - column[start]) for start, end in pairs]
+
+        return {
+            'revenue': diffs(prefix['revenue']),
+            'expense': diffs(prefix['expense']),
+            'count': [prefix['count'][end] - prefix['count'][start] for start, end in pairs],
+            'categories': {key: diffs(column) for key, column in list(prefix['categories'].items())},
+        }
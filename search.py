@@ -0,0 +1,257 @@
+"""فهرس مقلوب (inverted index) للبحث في وصف المعاملات وفئاتها
+
+النص يُوحَّد قبل الفهرسة والبحث: حذف التشكيل والتطويل، توحيد أشكال الألف
+(أ إ آ ٱ -> ا) والياء (ى -> ي) والتاء المربوطة (ة -> ه)، الأرقام العربية إلى
+أرقام لاتينية، والحروف اللاتينية إلى الصغيرة. كل كلمة في الاستعلام تطابق
+الكلمات المفهرسة التي تبدأ بها، والمعاملة تطابق إذا طابقت كل كلمات الاستعلام.
+
+الفهرس الرئيسي مضغوط في مصفوفات: المفردات مرتبة، ولكل مفردة مدى في مصفوفة
+واحدة من مواضع المعاملات (postings). الإضافات الجديدة تُلحق بذيل صغير يُدمج
+في المصفوفات عند تجاوز الحد، والحذف علامة على الموضع فقط - نفس تصميم Ledger.
+بجانب المواضع أعمدة صغيرة (الرقم، التاريخ، النوع، الفئة، المبلغ) تكفي
+للفلترة والترتيب والتقسيم إلى صفحات بدون الرجوع إلى السجل.
+"""
+import bisect
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+_DIACRITICS = 'ًٌٍَُِّْٰٕٓٔـ'
+_NORMALIZE = str.maketrans({
+    **{char: None for char in _DIACRITICS},
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ة': 'ه',
+    **{chr(0x0660 + d): str(d) for d in range(10)},
+    **{chr(0x06F0 + d): str(d) for d in range(10)},
+})
+_WORD = re.compile(r'\w+')
+# أكبر حرف ممكن: نهاية مدى الكلمات التي تبدأ ببادئة في المفردات المرتبة
+_PREFIX_END = '\U0010ffff'
+
+
+def normalize_text(text):
+    """توحيد نص للبحث (التشكيل وأشكال الألف والياء والتاء المربوطة والأرقام)"""
+    return str(text).translate(_NORMALIZE).lower()
+
+
+def tokenize(text):
+    """كلمات النص بعد التوحيد"""
+    return _WORD.findall(normalize_text(text))
+
+
+def _expand(codes, lists):
+    """(موضع الكود، العنصر) لكل عنصر في lists[code] لكل code في codes - بدون حلقة على codes"""
+    lengths = np.array([len(items) for items in lists], dtype='int64')
+    starts = np.cumsum(lengths) - lengths
+    flat = np.empty(lengths.sum(), dtype=object)
+    flat[:] = [item for items in lists for item in items]
+    counts = lengths[codes]
+    owners = np.repeat(np.arange(len(codes)), counts)
+    within = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owners, flat[np.repeat(starts[codes], counts) + within]
+
+
+def _frame_tokens(frame):
+    """(مواضع الصفوف، الكلمات) لكل كلمات وصف وفئة كل صف (قد تتكرر في نفس الصف)
+
+    التوحيد لا يغير المسافات، فالنص يُقسم على المسافات أولاً ثم يُوحَّد كل مقطع
+    مميز مرة واحدة: عدد المقاطع المميزة أصغر كثيراً من عدد الصفوف.
+    """
+    text = frame['description'].fillna('').astype(str) + ' ' + frame['category'].astype(str)
+    codes, texts = pd.factorize(text.to_numpy(dtype=object))
+    text_rows, chunks = _expand(codes, [t.split() for t in texts])
+    chunk_codes, unique_chunks = pd.factorize(chunks)
+    chunk_rows, tokens = _expand(chunk_codes, [tokenize(chunk) for chunk in unique_chunks])
+    return text_rows[chunk_rows], tokens
+
+
+class SearchIndex:
+    """فهرس البحث لسجل واحد - يُبنى مرة من DataFrame المعاملات ويُحدَّث مع كل إضافة وحذف"""
+
+    TAIL_LIMIT = 4096
+
+    def __init__(self, frame):
+        self._lock = threading.Lock()
+        self.ids = np.empty(0, dtype='int64')
+        self.dates = np.empty(0, dtype='int64')
+        self.revenue = np.empty(0, dtype=bool)
+        self.categories = np.empty(0, dtype='int32')
+        self.amounts = np.empty(0, dtype='float64')
+        self.category_names = []
+        self._category_codes = {}
+        self.vocabulary = np.empty(0, dtype=object)
+        self.offsets = np.zeros(1, dtype='int64')
+        self.postings = np.empty(0, dtype='int32')
+        self._positions = {}
+        self.deleted = set()
+        self.tail = []
+        self._append(frame)
+
+    def __len__(self):
+        return len(self.ids) + len(self.tail) - len(self.deleted)
+
+    def _category_code(self, name):
+        code = self._category_codes.get(name)
+        if code is None:
+            code = self._category_codes[name] = len(self.category_names)
+            self.category_names.append(name)
+        return code
+
+    def _append(self, frame):
+        """إضافة معاملات (DataFrame) إلى الأعمدة ودمج كلماتها مع المصفوفات"""
+        start = len(self.ids)
+        self.ids = np.concatenate([self.ids, frame['id'].to_numpy(dtype='int64')])
+        self.dates = np.concatenate([self.dates, frame['date'].to_numpy(dtype='datetime64[D]').astype('int64')])
+        self.revenue = np.concatenate([self.revenue, (frame['type'] == 'revenue').to_numpy()])
+        codes, names = pd.factorize(frame['category'].astype(str).to_numpy(dtype=object))
+        codes = np.asarray([self._category_code(name) for name in names], dtype='int32')[codes]
+        self.categories = np.concatenate([self.categories, codes.astype('int32')])
+        self.amounts = np.concatenate([self.amounts, frame['amount'].to_numpy(dtype='float64')])
+        for i, trans_id in enumerate(frame['id'].tolist()):
+            self._positions[trans_id] = start + i
+
+        # كلمات الدفعة كمصفوفات مرتبة مثل الفهرس الرئيسي
+        rows, tokens = _frame_tokens(frame)
+        new_codes, new_vocabulary = pd.factorize(tokens, sort=True)
+        new_vocabulary = np.asarray(new_vocabulary, dtype=object)
+        # أزواج (كلمة، صف) مميزة مرتبة بالكلمة ثم بالصف في مفتاح واحد
+        pairs = np.unique(new_codes.astype('int64') * max(len(frame), 1) + rows)
+        new_codes, rows = np.divmod(pairs, max(len(frame), 1))
+        new_postings = (rows + start).astype('int32')
+        new_counts = np.bincount(new_codes, minlength=len(new_vocabulary))
+        new_offsets = np.concatenate([[0], np.cumsum(new_counts)])
+
+        # الدمج: مواضع الدفعة أكبر من كل المواضع السابقة، فمدى كل كلمة هو مداها
+        # القديم ثم مداها الجديد - نقل بالمواضع بدون إعادة فرز الأزواج كلها
+        # المفردات الجديدة تُدرج في مواضعها من المفردات المرتبة (كلاهما مرتب)
+        positions = np.searchsorted(self.vocabulary, new_vocabulary)
+        found = np.zeros(len(new_vocabulary), dtype=bool)
+        inside = positions < len(self.vocabulary)
+        found[inside] = self.vocabulary[positions[inside]] == new_vocabulary[inside]
+        vocabulary = np.insert(self.vocabulary, positions[~found], new_vocabulary[~found])
+        old_map = np.searchsorted(vocabulary, self.vocabulary)
+        new_map = np.searchsorted(vocabulary, new_vocabulary)
+        old_counts = np.zeros(len(vocabulary), dtype='int64')
+        old_counts[old_map] = np.diff(self.offsets)
+        counts = old_counts.copy()
+        counts[new_map] += new_counts
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        postings = np.empty(offsets[-1], dtype='int32')
+        shift = np.repeat(offsets[old_map] - self.offsets[:-1], np.diff(self.offsets))
+        postings[shift + np.arange(len(self.postings))] = self.postings
+        shift = np.repeat(offsets[new_map] + old_counts[new_map] - new_offsets[:-1], new_counts)
+        postings[shift + np.arange(len(new_postings))] = new_postings
+        self.vocabulary, self.offsets, self.postings = vocabulary, offsets, postings
+
+    def add(self, transaction):
+        """إضافة معاملة واحدة إلى الذيل - تكلفة ثابتة"""
+        tokens = frozenset(tokenize(f"{transaction.get('description') or ''} {transaction['category']}"))
+        with self._lock:
+            self.tail.append((transaction, tokens))
+            if len(self.tail) >= self.TAIL_LIMIT:
+                self._compact()
+
+    def add_frame(self, frame):
+        """إضافة دفعة معاملات (استيراد) مباشرة إلى المصفوفات"""
+        with self._lock:
+            self._compact()
+            self._append(frame)
+
+    def remove(self, trans_id):
+        """حذف معاملة بالرقم (علامة على موضعها)"""
+        with self._lock:
+            position = self._positions.get(trans_id)
+            if position is not None:
+                self.deleted.add(position)
+            else:
+                self.tail = [(t, tokens) for t, tokens in self.tail if t['id'] != trans_id]
+
+    def _compact(self):
+        """دمج الذيل في المصفوفات"""
+        if self.tail:
+            frame = pd.DataFrame([t for t, _ in self.tail])
+            self.tail = []
+            self._append(frame.assign(date=pd.to_datetime(frame['date'])))
+
+    def _range(self, token):
+        """مدى المفردات التي تبدأ بـ token (بحث ثنائي في المفردات المرتبة)"""
+        start = bisect.bisect_left(self.vocabulary, token)
+        return start, bisect.bisect_left(self.vocabulary, token + _PREFIX_END, start)
+
+    def _candidates(self, tokens):
+        """مواضع المعاملات المطابقة لكل الكلمات في المصفوفات (بدون المحذوفة)
+
+        تبدأ بالكلمة الأقل مطابقات، وكل كلمة بعدها تفلتر النتيجة بقناع على المواضع
+        بدلاً من فرز مطابقاتها (البادئات القصيرة قد تطابق آلاف المفردات).
+        """
+        ranges = sorted(
+            (self._range(token) for token in tokens),
+            key=lambda r: self.offsets[r[1]] - self.offsets[r[0]]
+        )
+        rows = None
+        for start, end in ranges:
+            matches = self.postings[self.offsets[start]:self.offsets[end]]
+            if rows is None and end - start <= 1:
+                rows = matches
+            else:
+                mask = np.zeros(len(self.ids), dtype=bool)
+                mask[matches] = True
+                rows = np.flatnonzero(mask) if rows is None else rows[mask[rows]]
+            if not len(rows):
+                return rows
+        if self.deleted:
+            rows = rows[~np.isin(rows, np.fromiter(self.deleted, dtype='int32', count=len(self.deleted)))]
+        return rows
+
+    def search(self, text, trans_type=None, category=None, sort_by='date', descending=True, offset=0, limit=20):
+        """أرقام صفحة من المعاملات المطابقة للنص والفلاتر بعد الترتيب، وعدد كل المطابقات
+
+        الترتيب بالتاريخ افتراضياً (الأحدث أولاً)، وبباقي الأعمدة مع التاريخ مفتاحاً ثانوياً.
+        """
+        tokens = set(tokenize(text))
+        if not tokens:
+            return [], 0
+        with self._lock:
+            rows = self._candidates(tokens)
+            # الذيل صغير: يُفحص مباشرة ويُضاف كأعمدة بنفس الشكل
+            tail = [
+                t for t, words in self.tail
+                if all(any(word.startswith(token) for word in words) for token in tokens)
+            ]
+            ids = np.concatenate([self.ids[rows], np.array([t['id'] for t in tail], dtype='int64')])
+            dates = np.concatenate([
+                self.dates[rows], np.array([t['date'] for t in tail], dtype='datetime64[D]').astype('int64')
+            ])
+            revenue = np.concatenate([self.revenue[rows], np.array([t['type'] == 'revenue' for t in tail], dtype=bool)])
+            categories = np.concatenate([
+                self.categories[rows], np.array([self._category_code(t['category']) for t in tail], dtype='int32')
+            ])
+            amounts = np.concatenate([self.amounts[rows], np.array([t['amount'] for t in tail], dtype='float64')])
+            names = np.asarray(self.category_names, dtype=object)
+
+        mask = np.ones(len(ids), dtype=bool)
+        if trans_type is not None:
+            mask &= revenue == (trans_type == 'revenue')
+        if category is not None:
+            mask &= names[categories] == category if len(names) else False
+        ids, dates, revenue, categories, amounts = (
+            column[mask] for column in (ids, dates, revenue, categories, amounts)
+        )
+
+        # ترتيب زمني أولاً (كما في الجدول)، ثم ترتيب مستقر بالعمود المطلوب
+        order = np.lexsort((np.arange(len(ids)), dates))
+        if sort_by == 'date':
+            order = order[::-1] if descending else order
+        else:
+            if sort_by == 'amount':
+                keys = amounts[order]
+            elif sort_by == 'type':
+                keys = revenue[order].astype('int8')
+            else:
+                ranks = np.argsort(np.argsort(names)) if len(names) else names
+                keys = ranks[categories[order]]
+            order = order[np.argsort(-keys if descending else keys, kind='stable')]
+        return ids[order[offset:offset + limit]].tolist(), len(ids)
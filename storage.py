@@ -0,0 +1,895 @@
+"""طبقة تخزين المعاملات
+
+يتم اختيار الوضع بمتغير البيئة PL_STORAGE_MODE:
+- json: إعادة كتابة ملف transactions.json بالكامل عند كل تغيير (الوضع الافتراضي)
+- journal: سجل إلحاقي (سطر لكل عملية إضافة/حذف) مع ضغط دوري في الخلفية إلى اللقطة
+- sqlite: قاعدة بيانات transactions.db مع فهارس على التاريخ والنوع والفئة
+- shards: ملف لكل شهر في transactions.shards/ مع فهرس صغير (manifest)، والأشهر
+  المنتهية تُضغط بـ gzip
+- columnar: لقطة ثنائية عمودية transactions.cols تُربط بالذاكرة عند التحميل
+  (تنسيقها في columnar.py)
+
+الكتابة غير المتزامنة (PL_ASYNC_WRITES=1) تطبق الإضافة والحذف في الذاكرة فوراً
+وتحفظها على القرص في الخلفية خلال PL_FLUSH_MAX_DELAY_MS على الأكثر (غير
+متاحة في وضع sqlite).
+
+هذه الوحدة مستقلة عن Streamlit حتى تبقى الأقفال والخيوط الخلفية
+على مستوى العملية ولا يُعاد إنشاؤها مع كل إعادة تشغيل للسكريبت.
+"""
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+# قفل الملفات بين العمليات (غير متاح على Windows: يبقى الخيط الكاتب هو الضمان داخل العملية)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+DATA_FILE = 'transactions.json'
+JOURNAL_FILE = 'transactions.journal'
+DB_FILE = 'transactions.db'
+META_FILE = 'transactions.meta.json'
+LOCK_FILE = 'transactions.lock'
+SHARDS_DIR = 'transactions.shards'
+COLUMNAR_FILE = 'transactions.cols'
+CATEGORIES_FILE = 'categories.json'
+MANIFEST_FILE = 'manifest.json'
+
+# الفئات الأولى في سجل الفئات لكل سجل معاملات جديد
+DEFAULT_CATEGORIES = ["مبيعات", "خدمات", "رواتب", "إيجار", "مواد خام", "تسويق", "مرافق", "صيانة", "أخرى"]
+
+STORAGE_MODE = os.environ.get('PL_STORAGE_MODE', 'json')
+
+# عدد السجلات في الـ journal قبل تشغيل الضغط في الخلفية
+JOURNAL_COMPACT_EVERY = int(os.environ.get('PL_JOURNAL_COMPACT_EVERY', '1000'))
+
+# أقصى عدد عمليات تُحفظ معاً في دفعة واحدة من خيط الكتابة
+WRITE_BATCH_MAX = 1000
+
+# الكتابة غير المتزامنة: الحفظ بعد توقف العمليات FLUSH_DELAY ثانية، ولا تنتظر
+# أي عملية أكثر من FLUSH_MAX_DELAY ثانية (أقصى ما يضيع عند انقطاع الكهرباء)
+ASYNC_WRITES = os.environ.get('PL_ASYNC_WRITES', '') == '1'
+FLUSH_DELAY = float(os.environ.get('PL_FLUSH_DELAY_MS', '200')) / 1000
+FLUSH_MAX_DELAY = float(os.environ.get('PL_FLUSH_MAX_DELAY_MS', '2000')) / 1000
+
+logger = logging.getLogger('pl.storage')
+
+_journal_lock = threading.Lock()
+# لكل journal (مساره المطلق) عدد سجلاته وخيط ضغطه: batch.py قد يفتح عدة سجلات في نفس العملية
+_journal_records = {}
+_compaction_threads = {}
+
+
+def _fsync_dir(path):
+    """مزامنة المجلد بعد إعادة التسمية (غير مدعوم على Windows)"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def file_lock(path=LOCK_FILE):
+    """قفل حصري على ملفات البيانات بين كل العمليات التي تشغل التطبيق"""
+    with open(path, 'a') as f:
+        if FCNTL_AVAILABLE:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class GroupCommitWriter:
+    """خيط كتابة واحد للعملية يجمع عمليات كل الجلسات ويحفظها معاً
+
+    كل جلسة تضع عمليتها في الطابور وتنتظر نتيجتها. الخيط يسحب كل ما تراكم
+    في الطابور ويمرره إلى commit دفعة واحدة، فتكلفة الكتابة على القرص
+    تُدفع مرة لكل دفعة وليس لكل عملية. commit تستقبل قائمة العمليات
+    وترجع قائمة النتائج بنفس الترتيب.
+    """
+
+    def __init__(self, commit, batch_max=WRITE_BATCH_MAX):
+        self._commit = commit
+        self._batch_max = batch_max
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, operation):
+        """إضافة عملية للطابور وانتظار نتيجتها بعد حفظها"""
+        future = Future()
+        self._queue.put((operation, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self._batch_max:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                results = self._commit([operation for operation, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    future.set_exception(exc)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+
+
+class DebouncedWriter:
+    """كتابة غير متزامنة: العملية تُطبق في الذاكرة فوراً وتُحفظ لاحقاً في الخلفية
+
+    submit تستدعي apply وترجع النتيجة مباشرة دون انتظار القرص. الخيط الخلفي
+    ينتظر توقف العمليات delay ثانية (debounce) ثم يستدعي flush لحفظ كل ما
+    تراكم بكتابة واحدة، ولا تبقى عملية بدون حفظ أكثر من max_delay ثانية مهما
+    استمرت العمليات. المعلقات تُحفظ أيضاً عند خروج العملية (atexit).
+    apply تستقبل قائمة عمليات وترجع نتائجها، flush ترجع عدد ما حفظته،
+    و pending ترجع عدد العمليات التي لم تُحفظ بعد.
+    """
+
+    def __init__(self, apply, flush, pending, delay=FLUSH_DELAY, max_delay=FLUSH_MAX_DELAY):
+        self._apply = apply
+        self._flush = flush
+        self._pending = pending
+        self._delay = delay
+        self._max_delay = max_delay
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._first = None
+        self._last = None
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name='debounced-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def submit(self, operation):
+        """تطبيق العملية في الذاكرة وإرجاع نتيجتها - الحفظ يتم لاحقاً"""
+        result = self._apply([operation])[0]
+        with self._cond:
+            now = time.monotonic()
+            if self._first is None:
+                self._first = now
+            self._last = now
+            self._cond.notify()
+        return result
+
+    def pending(self):
+        """عدد العمليات التي لم تُحفظ على القرص بعد"""
+        return self._pending()
+
+    def flush(self):
+        """حفظ كل المعلقات الآن وانتظار انتهاء الكتابة - يرجع عددها"""
+        with self._flush_lock:
+            started = time.monotonic()
+            try:
+                count = self._flush()
+            except Exception as exc:
+                self.error = exc
+                raise
+            self.error = None
+            with self._cond:
+                # عمليات وصلت أثناء الكتابة تبقى معلقة: مهلتها تُحسب من بداية هذه الكتابة
+                self._first = started if self._pending() else None
+            return count
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._first is None:
+                    self._cond.wait()
+                while True:
+                    deadline = min(self._last + self._delay, self._first + self._max_delay)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('فشل حفظ العمليات المعلقة - إعادة المحاولة')
+                time.sleep(self._delay)
+
+
+def _file_signature(path):
+    """(وقت التعديل، الحجم) لملف أو None إذا لم يكن موجوداً"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def data_signature(mode=None, snapshot_path=DATA_FILE, journal_path=JOURNAL_FILE, db_path=DB_FILE,
+                   shards_dir=SHARDS_DIR, columnar_path=COLUMNAR_FILE):
+    """بصمة البيانات المخزنة: تتغير فقط عندما تتغير البيانات على القرص
+
+    قراءتها تكلف stat أو استعلاماً صغيراً بدلاً من قراءة السجل وتحليله.
+    """
+    mode = mode or STORAGE_MODE
+    if mode == 'shards':
+        # الـ manifest يُعاد كتابته بعد كل تغيير في أي شريحة
+        return ('shards', _file_signature(os.path.join(shards_dir, MANIFEST_FILE)))
+    if mode == 'sqlite':
+        return ('sqlite', db_version(db_path))
+    if mode == 'journal':
+        return ('journal', _file_signature(snapshot_path), _file_signature(journal_path))
+    if mode == 'columnar':
+        return ('columnar', _file_signature(columnar_path))
+    return ('json', _file_signature(snapshot_path))
+
+
+def read_snapshot(path=DATA_FILE):
+    """قراءة لقطة المعاملات الكاملة"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def write_snapshot(transactions, path=DATA_FILE):
+    """كتابة اللقطة بشكل ذري (ملف مؤقت ثم إعادة تسمية)"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(transactions, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path)
+
+
+def read_meta(path=META_FILE):
+    """قراءة البيانات الوصفية (عداد الأرقام next_id)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_meta(meta, path=META_FILE):
+    """كتابة البيانات الوصفية بشكل ذري"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# ---- سجل الفئات ----
+# categories.json قائمة أسماء الفئات المتاحة للإضافة بترتيب تسجيلها. تُلحق بها
+# الفئات فقط ولا يُحذف منها شيء، وهي مشتركة بين كل أوضاع التخزين.
+
+def read_categories(path=CATEGORIES_FILE):
+    """أسماء الفئات بترتيب تسجيلها (الفئات الافتراضية إذا لم يُنشأ السجل بعد)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)['categories']
+    except FileNotFoundError:
+        return list(DEFAULT_CATEGORIES)
+
+
+def categories_signature(path=CATEGORIES_FILE):
+    """بصمة سجل الفئات: تتغير عند إضافة فئة من أي عملية"""
+    return _file_signature(path)
+
+
+def register_categories(names, path=CATEGORIES_FILE):
+    """إضافة فئات جديدة إلى نهاية السجل (تحت قفل الملف) - يرجع السجل كاملاً"""
+    categories = read_categories(path)
+    known = set(categories)
+    new = [name for name in dict.fromkeys(names) if name not in known]
+    if new or not os.path.exists(path):
+        categories += new
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'categories': categories}, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    return categories
+
+
+def renumber_duplicates(transactions, next_id):
+    """رقم جديد لكل معاملة يتكرر رقمها (في مكانها) - يرجع الرقم التالي
+
+    الإصدارات القديمة كانت تعيد استخدام الأرقام بعد الحذف. الأقدم تاريخاً يحتفظ
+    برقمه مثل ترتيب الإطار في Ledger.
+    """
+    seen = set()
+    for t in sorted(transactions, key=lambda t: str(t['date'])[:10]):
+        if t['id'] in seen:
+            t['id'] = next_id
+            next_id += 1
+        seen.add(t['id'])
+    return next_id
+
+
+def next_id_after(transactions, events=(), meta_path=META_FILE):
+    """أول رقم غير مستخدم: أكبر من العداد المحفوظ ومن كل رقم ظهر في اللقطة أو الـ journal"""
+    next_id = read_meta(meta_path).get('next_id', 1)
+    for t in transactions:
+        next_id = max(next_id, t['id'] + 1)
+    for event in events:
+        trans_id = event['transaction']['id'] if event.get('op') == 'add' else event.get('id', 0)
+        next_id = max(next_id, trans_id + 1)
+    return next_id
+
+
+def read_journal(path=JOURNAL_FILE, limit=None):
+    """قراءة أحداث الـ journal حتى الإزاحة limit (بالبايت)"""
+    events = []
+    try:
+        with open(path, 'rb') as f:
+            data = f.read() if limit is None else f.read(limit)
+    except FileNotFoundError:
+        return events
+
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            events.append(json.loads(line.decode('utf-8')))
+        except ValueError:
+            # سطر أخير غير مكتمل بسبب انقطاع أثناء الكتابة
+            continue
+    return events
+
+
+def apply_events(transactions, events):
+    """تطبيق أحداث الـ journal بالترتيب على قائمة المعاملات
+
+    التطبيق متكرر الأمان (idempotent): إذا انقطع الضغط بعد كتابة اللقطة
+    وقبل تقليص الـ journal فإن إعادة تطبيق الأحداث لا تكرر المعاملات.
+    اللقطة يجب ألا تحتوي أرقاماً مكررة (init_journal)، وإلا فحذف رقم واحد
+    يحذف كل المعاملات التي تحمله.
+    """
+    ids = {t['id'] for t in transactions}
+    if len(ids) != len(transactions):
+        raise ValueError('اللقطة تحتوي أرقام معاملات مكررة - شغّل init_journal أولاً')
+    pending_deletes = set()
+    present = {(t['id'], t.get('timestamp')) for t in transactions}
+
+    def flush(items):
+        return [t for t in items if t['id'] not in pending_deletes]
+
+    for event in events:
+        if event.get('op') == 'delete':
+            pending_deletes.add(event['id'])
+        elif event.get('op') == 'add':
+            transaction = event['transaction']
+            # معاملة جديدة بنفس رقم معاملة محذوفة: نطبق الحذف أولاً
+            if transaction['id'] in pending_deletes:
+                transactions = flush(transactions)
+                present = {key for key in present if key[0] not in pending_deletes}
+                pending_deletes.clear()
+            key = (transaction['id'], transaction.get('timestamp'))
+            if key in present:
+                continue
+            present.add(key)
+            transactions.append(transaction)
+
+    if pending_deletes:
+        transactions = flush(transactions)
+    return transactions
+
+
+def _meta_beside(snapshot_path):
+    """ملف العداد في مجلد اللقطة"""
+    return os.path.join(os.path.dirname(snapshot_path), META_FILE)
+
+
+def init_journal(snapshot_path=DATA_FILE, journal_path=JOURNAL_FILE, meta_path=None):
+    """إعطاء المعاملات المكررة الرقم في اللقطة أرقاماً جديدة وحفظها مرة واحدة
+
+    Ledger يعيد ترقيم المكرر في الذاكرة فقط، وفي وضع journal لا تُعاد كتابة
+    اللقطة، فتتغير الأرقام الجديدة مع كل تحميل وحذف رقم مكرر يحذف كل نسخه.
+    الترقيم يُحفظ تحت قفل الملف (لقطة وعداد، مع دمج أي أحداث في الـ journal)
+    وتُسجل علامة unique_ids في العداد فلا تُفحص اللقطة مرة أخرى.
+    """
+    if meta_path is None:
+        meta_path = _meta_beside(snapshot_path)
+    if read_meta(meta_path).get('unique_ids'):
+        return
+    with file_lock(os.path.join(os.path.dirname(snapshot_path), LOCK_FILE)):
+        meta = read_meta(meta_path)
+        if meta.get('unique_ids'):
+            return
+        transactions = read_snapshot(snapshot_path)
+        if len({t['id'] for t in transactions}) != len(transactions):
+            _compact_journal(snapshot_path, journal_path, meta_path, force=True)
+        else:
+            write_meta({**meta, 'unique_ids': True}, meta_path)
+
+
+def load_journaled(snapshot_path=DATA_FILE, journal_path=JOURNAL_FILE, meta_path=None, read_only=False):
+    """تحميل اللقطة ثم إعادة تطبيق الـ journal عليها - يرجع (المعاملات، الرقم التالي)
+
+    read_only: بدون ضغط، والأرقام المكررة (لقطة لم يُشغل عليها init_journal)
+    تُرقم في الذاكرة فقط.
+    """
+    if meta_path is None:
+        meta_path = _meta_beside(snapshot_path)
+    transactions = read_snapshot(snapshot_path)
+    events = read_journal(journal_path)
+    next_id = next_id_after(transactions, events, meta_path)
+    if read_only:
+        next_id = renumber_duplicates(transactions, next_id)
+    else:
+        with _journal_lock:
+            _journal_records[os.path.abspath(journal_path)] = len(events)
+        _maybe_compact(snapshot_path, journal_path, meta_path)
+    return apply_events(transactions, events), next_id
+
+
+def append_event(event, snapshot_path=DATA_FILE, journal_path=JOURNAL_FILE, meta_path=None):
+    """إلحاق حدث واحد بالـ journal مع fsync - تكلفة ثابتة مهما كان حجم السجل"""
+    append_events([event], snapshot_path, journal_path, meta_path)
+
+
+def append_events(events, snapshot_path=DATA_FILE, journal_path=JOURNAL_FILE, meta_path=None):
+    """إلحاق مجموعة أحداث بكتابة واحدة و fsync واحد"""
+    data = ''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in events)
+    with _journal_lock:
+        with open(journal_path, 'a', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        key = os.path.abspath(journal_path)
+        _journal_records[key] = _journal_records.get(key, 0) + len(events)
+    _maybe_compact(snapshot_path, journal_path, meta_path)
+
+
+def _maybe_compact(snapshot_path, journal_path, meta_path=None):
+    """تشغيل الضغط في خيط خلفي عند تجاوز الحد"""
+    key = os.path.abspath(journal_path)
+    with _journal_lock:
+        if _journal_records.get(key, 0) < JOURNAL_COMPACT_EVERY:
+            return
+        thread = _compaction_threads.get(key)
+        if thread is not None and thread.is_alive():
+            return
+        thread = threading.Thread(
+            target=compact_journal,
+            args=(snapshot_path, journal_path, meta_path),
+            name='journal-compaction',
+            daemon=True
+        )
+        _compaction_threads[key] = thread
+        thread.start()
+
+
+def compact_journal(snapshot_path=DATA_FILE, journal_path=JOURNAL_FILE, meta_path=None):
+    """دمج الـ journal في اللقطة ثم حذف الأحداث المدموجة منه
+
+    اللقطة الجديدة تُبنى من الملفات على القرص وليس من نسخة جلسة معينة،
+    والأحداث التي تُلحق أثناء الضغط تبقى في الـ journal. ملف العداد
+    افتراضياً بجانب اللقطة (وليس في المجلد الحالي).
+    """
+    if meta_path is None:
+        meta_path = _meta_beside(snapshot_path)
+    # القفل بين العمليات أولاً ثم قفل الـ journal (نفس ترتيب خيط الكتابة)
+    with file_lock(os.path.join(os.path.dirname(snapshot_path), LOCK_FILE)):
+        _compact_journal(snapshot_path, journal_path, meta_path)
+
+
+def _compact_journal(snapshot_path, journal_path, meta_path, force=False):
+    """force: إعادة كتابة اللقطة (لترقيم المكرر) حتى لو كان الـ journal فارغاً"""
+    with _journal_lock:
+        try:
+            offset = os.path.getsize(journal_path)
+        except FileNotFoundError:
+            offset = 0
+        if offset == 0 and not force:
+            return
+
+    transactions = read_snapshot(snapshot_path)
+    events = read_journal(journal_path, offset)
+    # المكرر يُرقم قبل تطبيق الأحداث بنفس قاعدة Ledger (الأقدم يحتفظ برقمه)، فحذف
+    # رقمه يصيب نفس المعاملة التي حذفتها الجلسة
+    next_id = renumber_duplicates(transactions, next_id_after(transactions, events, meta_path))
+    # العداد يُحفظ قبل حذف الأحداث حتى لا يُعاد استخدام رقم معاملة محذوفة
+    write_meta({'next_id': next_id, 'unique_ids': True}, meta_path)
+    write_snapshot(apply_events(transactions, events), snapshot_path)
+    if offset == 0:
+        return
+
+    with _journal_lock:
+        with open(journal_path, 'rb') as f:
+            f.seek(offset)
+            remaining = f.read()
+        tmp_path = journal_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(remaining)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, journal_path)
+        _fsync_dir(journal_path)
+        _journal_records[os.path.abspath(journal_path)] = remaining.count(b'\n')
+
+
+# ===== SQLite =====
+
+TRANSACTION_COLUMNS = ('id', 'type', 'category', 'amount', 'date', 'description', 'timestamp')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    type TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    date TEXT NOT NULL,
+    description TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date);
+CREATE INDEX IF NOT EXISTS idx_transactions_type ON transactions(type, date);
+CREATE INDEX IF NOT EXISTS idx_transactions_category ON transactions(category, date);
+"""
+
+_db_initialized = set()
+_db_init_lock = threading.Lock()
+
+
+def connect_db(path=DB_FILE):
+    """فتح اتصال بقاعدة البيانات"""
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_db(path=DB_FILE, json_path=DATA_FILE):
+    """إنشاء الجداول والفهارس واستيراد transactions.json عند أول تشغيل"""
+    with _db_init_lock:
+        if path in _db_initialized:
+            return
+        with closing(connect_db(path)) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            is_empty = conn.execute('SELECT 1 FROM transactions LIMIT 1').fetchone() is None
+            if is_empty:
+                legacy = read_snapshot(json_path)
+                if legacy:
+                    _import_rows(conn, legacy)
+        _db_initialized.add(path)
+
+
+def _import_rows(conn, transactions):
+    """استيراد معاملات قديمة مع الحفاظ على أرقامها إن لم تكن مكررة"""
+    seen = set()
+    rows = []
+    for t in transactions:
+        trans_id = t.get('id')
+        if trans_id in seen:
+            trans_id = None
+        else:
+            seen.add(trans_id)
+        rows.append((trans_id, t['type'], t['category'], float(t['amount']),
+                     t['date'], t.get('description', ''), t.get('timestamp')))
+    with conn:
+        conn.executemany(
+            'INSERT INTO transactions (id, type, category, amount, date, description, timestamp) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            rows
+        )
+        _bump_db_version(conn)
+
+
+def _bump_db_version(conn):
+    """زيادة رقم إصدار البيانات داخل نفس معاملة الكتابة"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    conn.execute('PRAGMA user_version = %d' % (version + 1))
+
+
+def db_version(path=DB_FILE):
+    """رقم إصدار البيانات - يتغير مع كل كتابة من أي جلسة أو عملية"""
+    with closing(connect_db(path)) as conn:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def db_insert(transaction, path=DB_FILE):
+    """إدراج معاملة وإرجاع رقمها"""
+    with closing(connect_db(path)) as conn, conn:
+        cursor = conn.execute(
+            'INSERT INTO transactions (type, category, amount, date, description, timestamp) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (transaction['type'], transaction['category'], transaction['amount'],
+             transaction['date'], transaction['description'], transaction['timestamp'])
+        )
+        _bump_db_version(conn)
+        return cursor.lastrowid
+
+
+def db_insert_many(transactions, path=DB_FILE):
+    """إدراج دفعة معاملات في معاملة SQL واحدة"""
+    with closing(connect_db(path)) as conn, conn:
+        conn.executemany(
+            'INSERT INTO transactions (type, category, amount, date, description, timestamp) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(t['type'], t['category'], t['amount'], t['date'], t['description'], t['timestamp'])
+             for t in transactions]
+        )
+        _bump_db_version(conn)
+
+
+def db_apply(operations, path=DB_FILE):
+    """تنفيذ دفعة عمليات في معاملة SQL واحدة
+
+    العمليات: ('add', معاملة) ترجع رقمها، ('delete', رقم) ترجع الصفوف المحذوفة،
+    ('import', قائمة معاملات) ترجع عددها.
+    """
+    results = []
+    with closing(connect_db(path)) as conn, conn:
+        for op, payload in operations:
+            if op == 'add':
+                cursor = conn.execute(
+                    'INSERT INTO transactions (type, category, amount, date, description, timestamp) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (payload['type'], payload['category'], payload['amount'],
+                     payload['date'], payload['description'], payload['timestamp'])
+                )
+                results.append(cursor.lastrowid)
+            elif op == 'delete':
+                removed = [dict(row) for row in conn.execute(
+                    'SELECT ' + ', '.join(TRANSACTION_COLUMNS) + ' FROM transactions WHERE id = ?', (payload,)
+                )]
+                conn.execute('DELETE FROM transactions WHERE id = ?', (payload,))
+                results.append(removed)
+            elif op == 'import':
+                conn.executemany(
+                    'INSERT INTO transactions (type, category, amount, date, description, timestamp) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    [(t['type'], t['category'], t['amount'], t['date'], t['description'], t['timestamp'])
+                     for t in payload]
+                )
+                results.append(len(payload))
+        _bump_db_version(conn)
+    return results
+
+
+def db_delete(trans_id, path=DB_FILE):
+    """حذف معاملة بالرقم وإرجاع الصفوف المحذوفة"""
+    with closing(connect_db(path)) as conn, conn:
+        removed = [dict(row) for row in conn.execute(
+            'SELECT ' + ', '.join(TRANSACTION_COLUMNS) + ' FROM transactions WHERE id = ?', (trans_id,)
+        )]
+        conn.execute('DELETE FROM transactions WHERE id = ?', (trans_id,))
+        _bump_db_version(conn)
+        return removed
+
+
+def _where(date_from=None, date_to=None, trans_type=None, category=None):
+    """بناء شرط WHERE ومعاملاته من الفلاتر"""
+    clauses = []
+    params = []
+    if date_from is not None:
+        clauses.append('date >= ?')
+        params.append(date_from)
+    if date_to is not None:
+        clauses.append('date <= ?')
+        params.append(date_to)
+    if trans_type is not None:
+        clauses.append('type = ?')
+        params.append(trans_type)
+    if category is not None:
+        clauses.append('category = ?')
+        params.append(category)
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+
+def db_query(date_from=None, date_to=None, trans_type=None, category=None, path=DB_FILE):
+    """جلب المعاملات المطابقة فقط باستخدام الفهارس
+
+    date_from و date_to نصوص بصيغة YYYY-MM-DD والحدود شاملة.
+    """
+    where, params = _where(date_from, date_to, trans_type, category)
+    sql = 'SELECT ' + ', '.join(TRANSACTION_COLUMNS) + ' FROM transactions' + where + ' ORDER BY date, id'
+
+    with closing(connect_db(path)) as conn:
+        return [dict(row) for row in conn.execute(sql, params)]
+
+
+# ترتيب صفحات الجدول: العمود -> مفتاح ORDER BY (التاريخ والرقم لفض التساوي)
+_PAGE_ORDER = {
+    'date': 'date {dir}, id {dir}',
+    'amount': 'amount {dir}, date, id',
+    'category': 'category {dir}, date, id',
+    'type': 'type {dir}, date, id',
+}
+
+
+def db_page(trans_type=None, category=None, sort_by='date', descending=True, offset=0, limit=50, path=DB_FILE):
+    """صفحة واحدة من المعاملات المرتبة باستخدام LIMIT/OFFSET داخل SQL"""
+    where, params = _where(trans_type=trans_type, category=category)
+    order = _PAGE_ORDER[sort_by].format(dir='DESC' if descending else 'ASC')
+    sql = ('SELECT ' + ', '.join(TRANSACTION_COLUMNS) + ' FROM transactions' + where +
+           ' ORDER BY ' + order + ' LIMIT ? OFFSET ?')
+    with closing(connect_db(path)) as conn:
+        return [dict(row) for row in conn.execute(sql, params + [limit, offset])]
+
+
+def db_count(trans_type=None, category=None, path=DB_FILE):
+    """عدد المعاملات المطابقة للفلاتر"""
+    where, params = _where(trans_type=trans_type, category=category)
+    with closing(connect_db(path)) as conn:
+        return conn.execute('SELECT COUNT(*) FROM transactions' + where, params).fetchone()[0]
+
+
+def db_get(trans_id, path=DB_FILE):
+    """جلب معاملة واحدة بالرقم أو None"""
+    with closing(connect_db(path)) as conn:
+        row = conn.execute(
+            'SELECT ' + ', '.join(TRANSACTION_COLUMNS) + ' FROM transactions WHERE id = ?', (trans_id,)
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+
+def db_has_transactions(path=DB_FILE):
+    """هل توجد أي معاملة؟"""
+    with closing(connect_db(path)) as conn:
+        return conn.execute('SELECT 1 FROM transactions LIMIT 1').fetchone() is not None
+
+
+def db_daily_totals(path=DB_FILE):
+    """المجاميع لكل (يوم، نوع، فئة) مجمعة داخل SQL"""
+    with closing(connect_db(path)) as conn:
+        return [tuple(row) for row in conn.execute(
+            'SELECT date, type, category, SUM(amount), COUNT(*) FROM transactions '
+            'GROUP BY date, type, category'
+        )]
+
+
+# ---- الشرائح الشهرية ----
+#
+# كل شهر (YYYY-MM) له ملف JSON في SHARDS_DIR، والشهر المنتهي يُضغط بـ gzip.
+# الـ manifest يحمل لكل شريحة اسم ملفها وعدد صفوفها ومدى أرقامها ومجاميعها
+# اليومية، فالإحصائيات والتقارير لا تقرأ أي شريحة، وفلتر الفترة يقرأ الشرائح
+# التي تتقاطع معها فقط. الشريحة المعدلة تُكتب في ملف جديد (رقم الجيل في
+# اسمه) ثم يُكتب الـ manifest ذرياً: كتابته هي لحظة الحفظ، وتوقف العملية
+# قبلها يترك الملفات القديمة صالحة كما هي.
+
+def shard_month(day):
+    """الشهر YYYY-MM لتاريخ YYYY-MM-DD"""
+    return str(day)[:7]
+
+
+def read_manifest(shards_dir=SHARDS_DIR):
+    """قراءة الـ manifest أو None إذا لم تُنشأ الشرائح بعد"""
+    try:
+        with open(os.path.join(shards_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(manifest, shards_dir=SHARDS_DIR, exclusive=False):
+    """كتابة الـ manifest ذرياً ثم حذف ملفات الشرائح التي لم يعد يشير إليها
+
+    exclusive: الإنشاء فقط إذا لم يكن موجوداً (أول تشغيل من عدة عمليات معاً)،
+    ويرجع False إذا سبقتنا إليه عملية أخرى.
+    """
+    path = os.path.join(shards_dir, MANIFEST_FILE)
+    # ملفات الشرائح الجديدة يجب أن تكون على القرص قبل الـ manifest الذي يشير إليها
+    _fsync_dir(path)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    if exclusive:
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    _fsync_dir(path)
+    current = {entry['file'] for entry in manifest['shards'].values()} | {MANIFEST_FILE}
+    for name in os.listdir(shards_dir):
+        if name not in current and not name.endswith('.tmp'):
+            os.remove(os.path.join(shards_dir, name))
+    return True
+
+
+def read_shard(entry, shards_dir=SHARDS_DIR):
+    """معاملات شريحة واحدة (مضغوطة أو لا) حسب مدخلها في الـ manifest"""
+    path = os.path.join(shards_dir, entry['file'])
+    opener = gzip.open if entry['archived'] else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def shard_summary(transactions):
+    """عدد الصفوف ومدى الأرقام والمجاميع اليومية [يوم، نوع، فئة، مجموع، عدد] لشريحة"""
+    daily = {}
+    for t in transactions:
+        entry = daily.setdefault((t['date'], t['type'], t['category']), [0.0, 0])
+        entry[0] += t['amount']
+        entry[1] += 1
+    ids = [t['id'] for t in transactions]
+    return {
+        'rows': len(transactions),
+        'min_id': min(ids, default=0),
+        'max_id': max(ids, default=0),
+        'daily': [[*key, round(amount, 2), count] for key, (amount, count) in sorted(daily.items())],
+    }
+
+
+def write_shard(month, transactions, archived, generation, shards_dir=SHARDS_DIR):
+    """كتابة شريحة شهر في ملف جديد وإرجاع مدخلها للـ manifest (بدون كتابته)"""
+    name = f"{month}.{generation}.json{'.gz' if archived else ''}"
+    path = os.path.join(shards_dir, name)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    opener = gzip.open if archived else open
+    with opener(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(transactions, f, ensure_ascii=False)
+    with open(tmp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return {'file': name, 'archived': archived, **shard_summary(transactions)}
+
+
+def current_month():
+    """الشهر الحالي YYYY-MM: شريحته وحدها تبقى بدون ضغط"""
+    return datetime.now().strftime('%Y-%m')
+
+
+def archive_closed_shards(manifest, month=None, shards_dir=SHARDS_DIR):
+    """ضغط شرائح الأشهر المنتهية (قبل الشهر month) - يرجع True إذا تغير الـ manifest"""
+    month = month or current_month()
+    changed = False
+    for key, entry in manifest['shards'].items():
+        if key < month and not entry['archived']:
+            manifest['shards'][key] = write_shard(
+                key, read_shard(entry, shards_dir), True, manifest['generation'], shards_dir
+            )
+            changed = True
+    return changed
+
+
+def init_shards(shards_dir=SHARDS_DIR, json_path=DATA_FILE, meta_path=META_FILE):
+    """إنشاء الشرائح عند أول تشغيل بتقسيم transactions.json حسب الشهر"""
+    if read_manifest(shards_dir) is not None:
+        return
+    os.makedirs(shards_dir, exist_ok=True)
+    legacy = read_snapshot(json_path)
+    # المكرر يأخذ رقماً جديداً قبل التقسيم وإلا تبقى نسختان في شهرين مختلفين بنفس الرقم
+    next_id = renumber_duplicates(legacy, next_id_after(legacy, meta_path=meta_path))
+    by_month = {}
+    for t in legacy:
+        by_month.setdefault(shard_month(t['date']), []).append(t)
+    month = current_month()
+    manifest = {
+        'next_id': next_id,
+        'generation': 1,
+        'shards': {
+            key: write_shard(key, rows, key < month, 1, shards_dir)
+            for key, rows in sorted(by_month.items())
+        },
+    }
+    write_manifest(manifest, shards_dir, exclusive=True)